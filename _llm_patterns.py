@@ -0,0 +1,12 @@
+# _llm_patterns.py - Vorkompilierte Muster für das Parsen von LLM-Antworten im Textformat
+#
+# Gemeinsam genutzt von hybrid_model._parse_text_response und der kompilierten Variante
+# in _parse_fast.pyx, damit beide Implementierungen dieselben Muster verwenden.
+
+import re
+
+DIAGNOSES_RE = re.compile(r"(?:DIAGNOSEN:|Diagnosen:|Diagnose[n]?:|[1-5]\.|Mögliche Diagnosen:)(.*?)(?:(?:BEGRÜNDUNG|Begründung|BEHANDLUNG|Behandlung|ABRECHNUNGSCODE|Abrechnungscode):|\Z)", re.DOTALL)
+DIAGNOSIS_RE = re.compile(r"([\w\s\-äöüÄÖÜß\(\)]+)(?:[:-]\s*|:\s*|,\s*|–\s*|:\s*-\s*|\s+–\s+|\s+-\s+)(?:(\d+(?:\.\d+)?)%|(\d+(?:\.\d+)?))")
+TREATMENT_RE = re.compile(r"(?:BEHANDLUNG|Behandlung|Therapie|Treatment):\s*(.*?)(?:(?:ABRECHNUNGSCODE|Abrechnungscode|BEGRÜNDUNG|Begründung):|\Z)", re.DOTALL)
+CODE_RE = re.compile(r"(?:ABRECHNUNGSCODE|Abrechnungscode|ICD-10|ICD|Code):\s*([A-Z][0-9]+\.?[0-9]*)")
+REASON_RE = re.compile(r"(?:BEGRÜNDUNG|Begründung|Klinische Begründung|Rationale):\s*(.*?)(?:(?:BEHANDLUNG|Behandlung|ABRECHNUNGSCODE|Abrechnungscode):|\Z)", re.DOTALL)
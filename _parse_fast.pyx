@@ -0,0 +1,50 @@
+# cython: language_level=3
+# _parse_fast.pyx - Kompilierte Variante des Textformat-Parsers aus hybrid_model.py
+#
+# Bauen mit:  cythonize -3 -i _parse_fast.pyx
+# Ohne kompiliertes (oder mit veraltetem) Modul verwendet hybrid_model automatisch die reine
+# Python-Version; beim Import wird die Übereinstimmung beider Varianten an Beispielantworten geprüft.
+# Die Muster stammen aus _llm_patterns und werden nicht dupliziert.
+
+from _llm_patterns import (DIAGNOSES_RE as _DIAGNOSES_RE, DIAGNOSIS_RE as _DIAGNOSIS_RE,
+                           TREATMENT_RE as _TREATMENT_RE, CODE_RE as _CODE_RE, REASON_RE as _REASON_RE)
+
+
+def parse_text_response(str response_text):
+    """
+    Extrahiert Diagnosen, Behandlung, Abrechnungscode und Begründung aus einer
+    LLM-Antwort im Freitextformat.
+
+    Returns:
+        dict: Gefundene Felder (nur vorhandene Felder werden gesetzt)
+    """
+    cdef dict diagnosen = {}
+    cdef dict result = {"diagnosen": diagnosen}
+    cdef str diagnoses_text
+    cdef str name
+    cdef object match
+
+    # Diagnosen extrahieren
+    match = _DIAGNOSES_RE.search(response_text)
+    if match is not None:
+        diagnoses_text = match.group(1).strip()
+        for match in _DIAGNOSIS_RE.finditer(diagnoses_text):
+            name = match.group(1).strip().rstrip(':').rstrip('-').rstrip()
+            diagnosen[name] = float(match.group(2) if match.group(2) else match.group(3))
+
+    # Behandlung extrahieren
+    match = _TREATMENT_RE.search(response_text)
+    if match is not None:
+        result["behandlung"] = match.group(1).strip()
+
+    # Abrechnungscode extrahieren
+    match = _CODE_RE.search(response_text)
+    if match is not None:
+        result["abrechnungscode"] = match.group(1).strip()
+
+    # Begründung extrahieren
+    match = _REASON_RE.search(response_text)
+    if match is not None:
+        result["begründung"] = match.group(1).strip()
+
+    return result
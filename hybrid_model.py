@@ -3,14 +3,37 @@
 import json
 import os
 import requests
+import numpy as np
 import logging
 import time
 import re
+import threading
+import functools
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 from core import patient_verarbeiten
 from mimic_integration import MIMICIntegration
 
+# orjson ist optional und deutlich schneller als das json-Modul;
+# orjson.JSONDecodeError ist eine Unterklasse von json.JSONDecodeError
+try:
+    import orjson
+    _json_loads = orjson.loads
+    
+    def _json_dumps_pretty(obj):
+        """Formatierte JSON-Ausgabe (UTF-8, Einrückung 2)"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+    
+    def _json_dumps_pretty(obj):
+        """Formatierte JSON-Ausgabe (UTF-8, Einrückung 2)"""
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+
 # Umgebungsvariablen laden (.env Datei)
 load_dotenv()
 
@@ -25,11 +48,76 @@ logging.basicConfig(
 )
 logger = logging.getLogger("hybrid_model")
 
+class KeyPool:
+    """
+    Verwaltet mehrere API-Schlüssel eines Providers. Schlüssel werden reihum
+    vergeben; Schlüssel, die ein Rate-Limit (HTTP 429) erreicht haben, werden mit
+    exponentiell wachsender Wartezeit (1s, 2s, 4s, ...) vorübergehend gesperrt.
+    """
+
+    def __init__(self, keys, base_cooldown=1.0, max_cooldown=60.0, concurrent_per_key=4):
+        self.keys = [k for k in keys if k]
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        # Begrenzt gleichzeitige Anfragen pro Provider
+        self.semaphore = threading.BoundedSemaphore(max(1, len(self.keys)) * concurrent_per_key)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._cooldown_until = {k: 0.0 for k in self.keys}
+        self._strikes = {k: 0 for k in self.keys}
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self):
+        """
+        Liefert den nächsten verfügbaren Schlüssel (Round-Robin).
+        Sind alle Schlüssel gesperrt, wird der mit der kürzesten Restsperre geliefert.
+
+        Returns:
+            tuple: (Schlüssel, Restsperre in Sekunden; 0, wenn der Schlüssel sofort nutzbar ist)
+        """
+        with self._lock:
+            now = time.monotonic()
+            for _ in range(len(self.keys)):
+                key = self.keys[self._next]
+                self._next = (self._next + 1) % len(self.keys)
+                if self._cooldown_until[key] <= now:
+                    return key, 0.0
+            key = min(self.keys, key=self._cooldown_until.get)
+            return key, self._cooldown_until[key] - now
+
+    def mark_cooldown(self, key):
+        """Sperrt einen Schlüssel nach einem Rate-Limit mit exponentiellem Backoff."""
+        with self._lock:
+            self._strikes[key] += 1
+            cooldown = min(self.base_cooldown * 2 ** (self._strikes[key] - 1), self.max_cooldown)
+            self._cooldown_until[key] = time.monotonic() + cooldown
+
+    def mark_success(self, key):
+        """Setzt den Backoff eines Schlüssels nach erfolgreicher Anfrage zurück."""
+        with self._lock:
+            self._strikes[key] = 0
+
+def _load_api_keys(list_env, single_env):
+    """
+    Liest API-Schlüssel aus einer kommaseparierten Umgebungsvariable (z.B. OPENAI_API_KEYS)
+    und ergänzt den einzelnen Schlüssel (z.B. OPENAI_API_KEY), falls gesetzt.
+    """
+    keys = [k.strip() for k in os.environ.get(list_env, "").split(",") if k.strip()]
+    single_key = os.environ.get(single_env)
+    if single_key and single_key not in keys:
+        keys.append(single_key)
+    return KeyPool(keys)
+
 # Konfiguration der LLM-Provider
 # Unterstützt multiple Anbieter für Robustheit/Fallback
 LLM_CONFIGS = {
     "openai": {
-        "api_key": os.environ.get("OPENAI_API_KEY"),
+        "api_key": _load_api_keys("OPENAI_API_KEYS", "OPENAI_API_KEY"),
         "models": {
             "default": "gpt-3.5-turbo",
             "advanced": "gpt-4"
@@ -39,7 +127,7 @@ LLM_CONFIGS = {
         "temperature": 0.3
     },
     "anthropic": {
-        "api_key": os.environ.get("ANTHROPIC_API_KEY"),
+        "api_key": _load_api_keys("ANTHROPIC_API_KEYS", "ANTHROPIC_API_KEY"),
         "models": {
             "default": "claude-instant-1.2",
             "advanced": "claude-2"
@@ -48,7 +136,7 @@ LLM_CONFIGS = {
         "max_tokens": 800
     },
     "cohere": {
-        "api_key": os.environ.get("COHERE_API_KEY"),
+        "api_key": _load_api_keys("COHERE_API_KEYS", "COHERE_API_KEY"),
         "models": {
             "default": "command",
             "advanced": "command"
@@ -58,6 +146,10 @@ LLM_CONFIGS = {
     }
 }
 
+# Verfügbare Provider (mit API-Schlüssel) einmalig beim Import ermitteln,
+# da sich die Umgebungsvariablen zur Laufzeit nicht ändern
+_AVAILABLE_PROVIDERS = [(provider, config) for provider, config in LLM_CONFIGS.items() if config["api_key"]]
+
 # MIMIC-Integration initialisieren
 mimic = MIMICIntegration()
 
@@ -68,11 +160,7 @@ def get_available_llm_provider():
     Returns:
         tuple: (provider_name, config) oder (None, None) wenn kein Provider verfügbar
     """
-    for provider, config in LLM_CONFIGS.items():
-        if config["api_key"]:
-            return provider, config
-    
-    return None, None
+    return _AVAILABLE_PROVIDERS[0] if _AVAILABLE_PROVIDERS else (None, None)
 
 def call_llm_service(prompt, provider=None, model_type="default"):
     """
@@ -96,7 +184,7 @@ def call_llm_service(prompt, provider=None, model_type="default"):
     else:
         config = LLM_CONFIGS.get(provider)
         if not config or not config["api_key"]:
-            logger.warning(f"Der gewählte Provider '{provider}' ist nicht verfügbar.")
+            logger.warning("Der gewählte Provider '%s' ist nicht verfügbar.", provider)
             return {"error": f"Provider '{provider}' nicht verfügbar", "details": "API-Schlüssel fehlt"}
     
     # Provider-spezifische Anfrage vorbereiten
@@ -108,30 +196,59 @@ def call_llm_service(prompt, provider=None, model_type="default"):
         elif provider == "cohere":
             return _call_cohere_api(prompt, config, model_type)
         else:
-            logger.error(f"Unbekannter Provider: {provider}")
+            logger.error("Unbekannter Provider: %s", provider)
             return {"error": f"Unbekannter Provider", "details": provider}
     
     except Exception as e:
-        logger.error(f"Fehler beim Aufruf des LLM-Service ({provider}): {str(e)}")
+        logger.error("Fehler beim Aufruf des LLM-Service (%s): %s", provider, e)
         
         # Fallback auf anderen Provider, falls verfügbar
-        for fallback_provider, fallback_config in LLM_CONFIGS.items():
-            if fallback_provider != provider and fallback_config["api_key"]:
-                logger.info(f"Versuche Fallback auf Provider: {fallback_provider}")
+        for fallback_provider, _ in _AVAILABLE_PROVIDERS:
+            if fallback_provider != provider:
+                logger.info("Versuche Fallback auf Provider: %s", fallback_provider)
                 try:
                     return call_llm_service(prompt, fallback_provider, model_type)
                 except Exception as fallback_error:
-                    logger.error(f"Auch Fallback auf {fallback_provider} fehlgeschlagen: {str(fallback_error)}")
+                    logger.error("Auch Fallback auf %s fehlgeschlagen: %s", fallback_provider, fallback_error)
         
         return {"error": f"Fehler bei LLM-Anfrage", "details": str(e)}
 
+# Zeitlimit (Sekunden) einer LLM-Anfrage; begrenzt auch das Warten auf einen gesperrten Schlüssel
+LLM_REQUEST_TIMEOUT = 30
+
+def _post_with_key_pool(config, build_headers, data):
+    """
+    Sendet eine Anfrage an den Provider-Endpunkt und rotiert dabei durch die
+    API-Schlüssel des Providers. Bei einem Rate-Limit (HTTP 429) wird der Schlüssel
+    gesperrt und die Anfrage mit dem nächsten Schlüssel wiederholt. Sind alle Schlüssel
+    gesperrt, wird die Restsperre (höchstens LLM_REQUEST_TIMEOUT) abgewartet; auch mit
+    nur einem Schlüssel gibt es so mindestens einen Versuch nach der Sperre.
+
+    Returns:
+        requests.Response: Antwort des letzten Versuchs
+    """
+    pool = config["api_key"]
+    with pool.semaphore:
+        for _ in range(len(pool) + 1):
+            key, wait = pool.acquire()
+            if wait > 0:
+                logger.info("Alle API-Schlüssel gesperrt, warte %.1fs", min(wait, LLM_REQUEST_TIMEOUT))
+                time.sleep(min(wait, LLM_REQUEST_TIMEOUT))
+            response = requests.post(
+                config["endpoint"],
+                headers=build_headers(key),
+                json=data,
+                timeout=LLM_REQUEST_TIMEOUT
+            )
+            if response.status_code != 429:
+                pool.mark_success(key)
+                return response
+            logger.warning("Rate-Limit für API-Schlüssel erreicht, wechsle Schlüssel")
+            pool.mark_cooldown(key)
+    return response
+
 def _call_openai_api(prompt, config, model_type):
     """Ruft die OpenAI API auf"""
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {config['api_key']}"
-    }
-    
     model = config["models"][model_type]
     
     data = {
@@ -141,27 +258,26 @@ def _call_openai_api(prompt, config, model_type):
         "temperature": config["temperature"]
     }
     
-    logger.info(f"Sende Anfrage an OpenAI API mit Modell {model}")
-    response = requests.post(
-        config["endpoint"],
-        headers=headers,
-        json=data,
-        timeout=30
+    logger.info("Sende Anfrage an OpenAI API mit Modell %s", model)
+    response = _post_with_key_pool(
+        config,
+        lambda key: {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {key}"
+        },
+        data
     )
     
     if response.status_code == 200:
         return response.json()["choices"][0]["message"]["content"]
     else:
-        logger.error(f"OpenAI API-Fehler: {response.status_code}, {response.text}")
-        raise Exception(f"OpenAI API-Fehler: {response.status_code}, {response.text}")
+        # response.text dekodiert den Body bei jedem Zugriff, daher nur einmal formatieren
+        error_message = f"OpenAI API-Fehler: {response.status_code}, {response.text}"
+        logger.error(error_message)
+        raise Exception(error_message)
 
 def _call_anthropic_api(prompt, config, model_type):
     """Ruft die Anthropic Claude API auf"""
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": config["api_key"]
-    }
-    
     model = config["models"][model_type]
     
     data = {
@@ -172,27 +288,25 @@ def _call_anthropic_api(prompt, config, model_type):
         "stop_sequences": ["\n\nHuman:"]
     }
     
-    logger.info(f"Sende Anfrage an Anthropic API mit Modell {model}")
-    response = requests.post(
-        config["endpoint"],
-        headers=headers,
-        json=data,
-        timeout=30
+    logger.info("Sende Anfrage an Anthropic API mit Modell %s", model)
+    response = _post_with_key_pool(
+        config,
+        lambda key: {
+            "Content-Type": "application/json",
+            "x-api-key": key
+        },
+        data
     )
     
     if response.status_code == 200:
         return response.json()["completion"]
     else:
-        logger.error(f"Anthropic API-Fehler: {response.status_code}, {response.text}")
-        raise Exception(f"Anthropic API-Fehler: {response.status_code}, {response.text}")
+        error_message = f"Anthropic API-Fehler: {response.status_code}, {response.text}"
+        logger.error(error_message)
+        raise Exception(error_message)
 
 def _call_cohere_api(prompt, config, model_type):
     """Ruft die Cohere API auf"""
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {config['api_key']}"
-    }
-    
     model = config["models"][model_type]
     
     data = {
@@ -204,24 +318,29 @@ def _call_cohere_api(prompt, config, model_type):
         "p": 0.75
     }
     
-    logger.info(f"Sende Anfrage an Cohere API mit Modell {model}")
-    response = requests.post(
-        config["endpoint"],
-        headers=headers,
-        json=data,
-        timeout=30
+    logger.info("Sende Anfrage an Cohere API mit Modell %s", model)
+    response = _post_with_key_pool(
+        config,
+        lambda key: {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {key}"
+        },
+        data
     )
     
     if response.status_code == 200:
         return response.json()["generations"][0]["text"]
     else:
-        logger.error(f"Cohere API-Fehler: {response.status_code}, {response.text}")
-        raise Exception(f"Cohere API-Fehler: {response.status_code}, {response.text}")
+        error_message = f"Cohere API-Fehler: {response.status_code}, {response.text}"
+        logger.error(error_message)
+        raise Exception(error_message)
 
+@functools.lru_cache(maxsize=256)
 def get_medical_prompt(symptome, vitals_string, alter, zusatz_info=""):
     """
     Erstellt einen medizinischen Prompt für das LLM mit verbessertem Kontext und 
     strukturiertem Format für bessere Parsing-Ergebnisse.
+    Der Prompt hängt nur von den Argumenten ab und wird daher zwischengespeichert.
     
     Returns:
         str: Formatierter Prompt für medizinische LLM-Anfrage
@@ -367,6 +486,75 @@ def get_medical_prompt(symptome, vitals_string, alter, zusatz_info=""):
     
     return prompt
 
+# Vorkompilierte Muster für das Parsen von LLM-Antworten im Textformat (gemeinsam mit _parse_fast)
+from _llm_patterns import (DIAGNOSES_RE as _DIAGNOSES_RE, DIAGNOSIS_RE as _DIAGNOSIS_RE,
+                           TREATMENT_RE as _TREATMENT_RE, CODE_RE as _CODE_RE, REASON_RE as _REASON_RE)
+
+def _parse_text_response(response_text):
+    """
+    Extrahiert Diagnosen, Behandlung, Abrechnungscode und Begründung aus einer
+    LLM-Antwort im Freitextformat.
+    
+    Wird durch die kompilierte Variante aus _parse_fast ersetzt, falls verfügbar und
+    mit dieser Version übereinstimmend.
+    
+    Returns:
+        dict: Gefundene Felder (nur vorhandene Felder werden gesetzt)
+    """
+    result = {"diagnosen": {}}
+    
+    # Diagnosen extrahieren
+    diagnoses_match = _DIAGNOSES_RE.search(response_text)
+    if diagnoses_match:
+        diagnoses_text = diagnoses_match.group(1).strip()
+        for match in _DIAGNOSIS_RE.finditer(diagnoses_text):
+            name = match.group(1).strip().rstrip(':').rstrip('-').rstrip()
+            percentage = float(match.group(2) if match.group(2) else match.group(3))
+            result["diagnosen"][name] = percentage
+    
+    # Behandlung extrahieren
+    treatment_match = _TREATMENT_RE.search(response_text)
+    if treatment_match:
+        result["behandlung"] = treatment_match.group(1).strip()
+    
+    # Abrechnungscode extrahieren
+    code_match = _CODE_RE.search(response_text)
+    if code_match:
+        result["abrechnungscode"] = code_match.group(1).strip()
+    
+    # Begründung extrahieren
+    reason_match = _REASON_RE.search(response_text)
+    if reason_match:
+        result["begründung"] = reason_match.group(1).strip()
+    
+    return result
+
+# Beispielantworten für den Abgleich der kompilierten Variante mit der Python-Version
+_PARSE_SAMPLES = (
+    "DIAGNOSEN:\n1. Pneumonie: 60%\n2. Akute Bronchitis - 25%\n3. Lungenembolie, 15\n"
+    "BEGRÜNDUNG: Fieber und Husten mit Rasselgeräuschen.\n"
+    "BEHANDLUNG: Antibiotikatherapie, Flüssigkeitszufuhr.\n"
+    "ABRECHNUNGSCODE: J18.9",
+    "Mögliche Diagnosen: Migräne – 70%, Spannungskopfschmerz – 30%\n"
+    "Therapie: Ibuprofen 400 mg\nICD-10: G43.9\nRationale: Einseitiger, pulsierender Kopfschmerz.",
+    "Diagnose: Harnwegsinfektion (Zystitis): 85.5%\nBehandlung: Fosfomycin\nCode: N30.0",
+    "Keine strukturierte Antwort.",
+)
+
+# Kompilierte Variante (Cython) verwenden, falls gebaut und mit der Python-Version übereinstimmend
+# (ein veraltetes kompiliertes Modul nach Änderungen an dieser Funktion wird so nicht verwendet)
+try:
+    from _parse_fast import parse_text_response as _parse_text_response_fast
+except ImportError:
+    _parse_text_response_fast = None
+
+if _parse_text_response_fast is not None:
+    if all(_parse_text_response_fast(sample) == _parse_text_response(sample) for sample in _PARSE_SAMPLES):
+        _parse_text_response = _parse_text_response_fast
+    else:
+        logger.warning("Kompiliertes _parse_fast weicht von der Python-Version ab und wird nicht verwendet "
+                       "(neu bauen mit: cythonize -3 -i _parse_fast.pyx)")
+
 def parse_llm_response(response_text):
     """
     Verbesserte Parsing-Funktion für die LLM-Antwort, die verschiedene Formate erkennt
@@ -387,65 +575,32 @@ def parse_llm_response(response_text):
     }
     
     try:
-        # 1. Versuche, JSON-Format zu erkennen und zu parsen
-        json_pattern = r'```json\s*(.*?)\s*```'
-        json_match = re.search(json_pattern, response_text, re.DOTALL)
+        # 1. Versuche, JSON-Codeblock zu erkennen und zu parsen (lineare Suche statt Regex)
+        block_start = response_text.find("```json")
+        block_end = response_text.find("```", block_start + 7) if block_start >= 0 else -1
         
-        if json_match:
-            json_data = json_match.group(1).strip()
+        if block_end >= 0:
+            json_data = response_text[block_start + 7:block_end].strip()
             try:
-                parsed_data = json.loads(json_data)
-                return parsed_data
+                return _json_loads(json_data)
             except json.JSONDecodeError:
-                logger.warning(f"Fehler beim Parsen des JSON-Formats: {json_data}")
+                logger.warning("Fehler beim Parsen des JSON-Formats: %s", json_data)
         
         # 2. Wenn keine JSON-Codeblöcke gefunden wurden, versuche direktes JSON-Format
-        if response_text.strip().startswith('{') and response_text.strip().endswith('}'):
+        stripped_text = response_text.strip()
+        if stripped_text.startswith('{') and stripped_text.endswith('}'):
             try:
-                parsed_data = json.loads(response_text)
-                return parsed_data
+                return _json_loads(stripped_text)
             except json.JSONDecodeError:
                 logger.warning("Fehler beim Parsen des direkten JSON-Formats")
         
         # 3. Wenn kein JSON-Format gefunden wird, versuche reguläre Ausdrücke für Textformat
-        # Diagnosen extrahieren
-        diagnoses_pattern = r"(?:DIAGNOSEN:|Diagnosen:|Diagnose[n]?:|[1-5]\.|Mögliche Diagnosen:)(.*?)(?:(?:BEGRÜNDUNG|Begründung|BEHANDLUNG|Behandlung|ABRECHNUNGSCODE|Abrechnungscode):|\Z)"
-        diagnoses_match = re.search(diagnoses_pattern, response_text, re.DOTALL)
-        
-        if diagnoses_match:
-            diagnoses_text = diagnoses_match.group(1).strip()
-            diagnosis_pattern = r"([\w\s\-äöüÄÖÜß\(\)]+)(?:[:-]\s*|:\s*|,\s*|–\s*|:\s*-\s*|\s+–\s+|\s+-\s+)(?:(\d+(?:\.\d+)?)%|(\d+(?:\.\d+)?))"
-            
-            for match in re.finditer(diagnosis_pattern, diagnoses_text):
-                name = match.group(1).strip().rstrip(':').rstrip('-').rstrip()
-                percentage = float(match.group(2) if match.group(2) else match.group(3))
-                result["diagnosen"][name] = percentage
-        
-        # Behandlung extrahieren
-        treatment_pattern = r"(?:BEHANDLUNG|Behandlung|Therapie|Treatment):\s*(.*?)(?:(?:ABRECHNUNGSCODE|Abrechnungscode|BEGRÜNDUNG|Begründung):|\Z)"
-        treatment_match = re.search(treatment_pattern, response_text, re.DOTALL)
-        
-        if treatment_match:
-            result["behandlung"] = treatment_match.group(1).strip()
-        
-        # Abrechnungscode extrahieren
-        code_pattern = r"(?:ABRECHNUNGSCODE|Abrechnungscode|ICD-10|ICD|Code):\s*([A-Z][0-9]+\.?[0-9]*)"
-        code_match = re.search(code_pattern, response_text)
-        
-        if code_match:
-            result["abrechnungscode"] = code_match.group(1).strip()
-        
-        # Begründung extrahieren
-        reason_pattern = r"(?:BEGRÜNDUNG|Begründung|Klinische Begründung|Rationale):\s*(.*?)(?:(?:BEHANDLUNG|Behandlung|ABRECHNUNGSCODE|Abrechnungscode):|\Z)"
-        reason_match = re.search(reason_pattern, response_text, re.DOTALL)
-        
-        if reason_match:
-            result["begründung"] = reason_match.group(1).strip()
+        result.update(_parse_text_response(response_text))
         
         return result
     
     except Exception as e:
-        logger.error(f"Fehler beim Parsen der LLM-Antwort: {str(e)}")
+        logger.error("Fehler beim Parsen der LLM-Antwort: %s", e)
         return {"error": f"Fehler beim Parsen der LLM-Antwort: {str(e)}"}
     
 def find_matching_diagnosis(target_diagnosis, diagnoses_dict):
@@ -493,6 +648,116 @@ def find_matching_diagnosis(target_diagnosis, diagnoses_dict):
     # Nur zurückgeben, wenn ausreichende Übereinstimmung
     return best_match if best_score > 0.25 else None
 
+# Hochspezifische Symptomkonstellationen, die die Top-Diagnose direkt festlegen
+SPECIFIC_PATTERNS = {
+    ("brustschmerzen", "ausstrahlung", "arm"): "Akuter Herzinfarkt",
+    ("fieber", "nackensteifigkeit", "kopfschmerzen"): "Meningitis"
+}
+
+# Kritische Symptomkombinationen mit Zieldiagnose und Verstärkungsfaktor
+CRITICAL_PATTERNS = {
+    ("brustschmerzen", "schwitzen", "übelkeit"): ["Akuter Herzinfarkt", 3.0],
+    ("fieber", "husten", "atemnot"): ["Pneumonie", 2.5],
+    ("kopfschmerzen", "fieber", "erbrechen"): ["Meningitis", 2.7],
+    ("bauchschmerzen", "erbrechen", "appetitlosigkeit"): ["Appendizitis", 2.2],
+    ("dyspnoe", "husten", "orthopnoe"): ["Herzinsuffizienz", 2.3]
+}
+
+# Jedes Symptom-Token aller Muster erhält ein Bit; ein Muster ist die Bitmaske seiner Tokens.
+# So wird symptom_text pro Aufruf nur einmal durchsucht.
+_PATTERN_TOKEN_BITS = {
+    token: 1 << i
+    for i, token in enumerate(sorted(
+        {token for pattern in SPECIFIC_PATTERNS for token in pattern} |
+        {token for pattern in CRITICAL_PATTERNS for token in pattern}
+    ))
+}
+
+def _pattern_mask(pattern):
+    """Bitmaske eines Symptommusters"""
+    return sum(_PATTERN_TOKEN_BITS[token] for token in pattern)
+
+# Vorkompilierte Tabellen: (Bitmaske des Musters, Zieldiagnose[, Verstärkungsfaktor])
+_SPECIFIC_TABLE = tuple(
+    (_pattern_mask(pattern), target_diagnosis)
+    for pattern, target_diagnosis in SPECIFIC_PATTERNS.items()
+)
+_CRITICAL_TABLE = tuple(
+    (_pattern_mask(pattern), target_diagnosis, factor)
+    for pattern, (target_diagnosis, factor) in CRITICAL_PATTERNS.items()
+)
+
+# Aho-Corasick-Automat (pyahocorasick) findet alle Tokens in einem Durchlauf, falls installiert
+try:
+    import ahocorasick
+    _pattern_automaton = ahocorasick.Automaton()
+    for _token, _bit in _PATTERN_TOKEN_BITS.items():
+        _pattern_automaton.add_word(_token, _bit)
+    _pattern_automaton.make_automaton()
+except ImportError:
+    _pattern_automaton = None
+
+def _pattern_token_mask(symptom_text):
+    """
+    Ermittelt, welche Symptom-Tokens aus SPECIFIC_PATTERNS und CRITICAL_PATTERNS
+    in symptom_text vorkommen.
+    
+    Returns:
+        int: Bitmaske der gefundenen Tokens
+    """
+    present_mask = 0
+    if _pattern_automaton is not None:
+        for _, bit in _pattern_automaton.iter(symptom_text):
+            present_mask |= bit
+    else:
+        for token, bit in _PATTERN_TOKEN_BITS.items():
+            if token in symptom_text:
+                present_mask |= bit
+    return present_mask
+
+# Diagnosen, die bei Kindern deutlich abgewertet werden
+_ADULT_DIAGNOSES = frozenset(("Myokardinfarkt", "Akuter Herzinfarkt", "Angina pectoris"))
+
+class _DiagTable:
+    """
+    Diagnosen während der Ergebniskombination als parallele Arrays:
+    Namen, Wahrscheinlichkeiten (float64) und ein Index Name -> Position.
+    Erst am Ende wird wieder ein Dictionary erzeugt.
+    """
+    __slots__ = ("names", "vals", "index")
+    
+    def __init__(self, diagnosen):
+        self.names = list(diagnosen)
+        self.vals = np.fromiter(diagnosen.values(), dtype=np.float64, count=len(self.names))
+        self.index = {name: idx for idx, name in enumerate(self.names)}
+    
+    def __contains__(self, name):
+        return name in self.index
+    
+    def __getitem__(self, name):
+        return self.vals[self.index[name]]
+    
+    def multiply(self, name, factor):
+        """Multipliziert die Wahrscheinlichkeit einer vorhandenen Diagnose"""
+        self.vals[self.index[name]] *= factor
+    
+    def set(self, name, value):
+        """Setzt die Wahrscheinlichkeit einer Diagnose, neue Diagnosen werden angehängt"""
+        idx = self.index.get(name)
+        if idx is None:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            self.vals = np.append(self.vals, value)
+        else:
+            self.vals[idx] = value
+    
+    def to_dict(self):
+        """
+        Returns:
+            dict: Diagnosen mit Wahrscheinlichkeiten in Einfügereihenfolge
+        """
+        return dict(zip(self.names, self.vals.tolist()))
+
 def enhance_ml_results(ml_results, llm_results, mimic_results, symptome, vitals_string, alter, zusatz_info=""):
     """
     Verbesserte Funktion zur Kombination von ML-Ergebnissen mit LLM-Insights und 
@@ -510,25 +775,11 @@ def enhance_ml_results(ml_results, llm_results, mimic_results, symptome, vitals_
     Returns:
         dict: Erweiterte und optimierte Diagnoseergebnisse
     """
-    # Kopie der ML-Ergebnisse erstellen
-    enhanced_results = ml_results.copy()
-    
     # Symptom- und Zusatzinformationen kombinieren für Kontextanalyse
     symptom_text = symptome.lower() + " " + zusatz_info.lower()
     
     # 1. SPEZIFISCHE ÜBERSCHREIBUNGEN FÜR EINDEUTIGE KLINISCHE FÄLLE
     
-    # Hochspezifische Symptomkonstellationen erkennen
-    if "brustschmerzen" in symptom_text and "ausstrahlung" in symptom_text and "arm" in symptom_text:
-        if "Akuter Herzinfarkt" in enhanced_results["diagnosen"]:
-            enhanced_results["diagnosen"]["Akuter Herzinfarkt"] *= 2.0
-            enhanced_results["top_diagnose"] = "Akuter Herzinfarkt"
-            
-    if "fieber" in symptom_text and "nackensteifigkeit" in symptom_text and "kopfschmerzen" in symptom_text:
-        if "Meningitis" in enhanced_results["diagnosen"]:
-            enhanced_results["diagnosen"]["Meningitis"] *= 2.0
-            enhanced_results["top_diagnose"] = "Meningitis"
-    
     # Allergiefall-Erkennung und Überschreibung
     is_allergy_case = (
         ("ausschlag" in symptom_text or "quaddel" in symptom_text or "urtik" in symptom_text or "juck" in symptom_text) and
@@ -545,30 +796,34 @@ def enhance_ml_results(ml_results, llm_results, mimic_results, symptome, vitals_
         if "dyspnoe" in symptom_text or "atem" in symptom_text:
             severity = "schwer"  # Dyspnoe deutet auf schwerere Reaktion hin
         
-        # Diagnosen nach Schweregrad festlegen
+        # Diagnosen nach Schweregrad festlegen (ersetzen die ML-Diagnosen vollständig)
         if severity == "schwer":
-            enhanced_results["diagnosen"] = {
-                "Anaphylaktische Reaktion": 45.0,
-                "Nahrungsmittelallergie": 35.0,
-                "Urtikaria": 15.0,
-                "Angioödem": 5.0
+            overrides = {
+                "diagnosen": {
+                    "Anaphylaktische Reaktion": 45.0,
+                    "Nahrungsmittelallergie": 35.0,
+                    "Urtikaria": 15.0,
+                    "Angioödem": 5.0
+                },
+                "top_diagnose": "Anaphylaktische Reaktion",
+                "behandlung": "NOTFALL: Sofortige Gabe von Adrenalin, Antihistaminika, Glucocorticoide. Überwachung der Vitalparameter. Ggf. Einweisung in Notaufnahme. Nach Stabilisierung Allergenvermeidung und Patientenschulung.",
+                "abrechnungscode": "T78.2"
             }
-            enhanced_results["top_diagnose"] = "Anaphylaktische Reaktion"
-            enhanced_results["behandlung"] = "NOTFALL: Sofortige Gabe von Adrenalin, Antihistaminika, Glucocorticoide. Überwachung der Vitalparameter. Ggf. Einweisung in Notaufnahme. Nach Stabilisierung Allergenvermeidung und Patientenschulung."
-            enhanced_results["abrechnungscode"] = "T78.2"
         else:
-            enhanced_results["diagnosen"] = {
-                "Urtikaria": 40.0,
-                "Nahrungsmittelallergie": 35.0,
-                "Allergische Reaktion": 20.0,
-                "Angioödem": 5.0
+            overrides = {
+                "diagnosen": {
+                    "Urtikaria": 40.0,
+                    "Nahrungsmittelallergie": 35.0,
+                    "Allergische Reaktion": 20.0,
+                    "Angioödem": 5.0
+                },
+                "top_diagnose": "Urtikaria",
+                "behandlung": "Antihistaminika (z.B. Cetirizin), ggf. kurzfristig Glucocorticoide. Identifikation und Vermeidung des auslösenden Allergens. Bei wiederholten Reaktionen allergologische Abklärung.",
+                "abrechnungscode": "L50.0"
             }
-            enhanced_results["top_diagnose"] = "Urtikaria"
-            enhanced_results["behandlung"] = "Antihistaminika (z.B. Cetirizin), ggf. kurzfristig Glucocorticoide. Identifikation und Vermeidung des auslösenden Allergens. Bei wiederholten Reaktionen allergologische Abklärung."
-            enhanced_results["abrechnungscode"] = "L50.0"
         
         # Vorzeitige Rückgabe bei diesem spezifischen Fall
-        return enhanced_results
+        return {**ml_results, **overrides}
     
     # Weitere spezifische klinische Szenarien
     # Harnwegsinfektionsfall
@@ -583,27 +838,46 @@ def enhance_ml_results(ml_results, llm_results, mimic_results, symptome, vitals_
         has_fever = "fieber" in symptom_text or (vitals_string and any(x in vitals_string for x in ["T:38", "T:39", "T:40"]))
         has_flank_pain = any(term in symptom_text for term in ["flanke", "rücken", "niere", "seitenschmerz"])
         
-        # Diagnosen nach Faktoren festlegen
+        # Diagnosen nach Faktoren festlegen (ersetzen die ML-Diagnosen vollständig)
         if has_fever and has_flank_pain:
-            enhanced_results["diagnosen"] = {
-                "Pyelonephritis": 60.0,
-                "Harnwegsinfektion": 25.0,
-                "Zystitis": 15.0
+            overrides = {
+                "diagnosen": {
+                    "Pyelonephritis": 60.0,
+                    "Harnwegsinfektion": 25.0,
+                    "Zystitis": 15.0
+                },
+                "top_diagnose": "Pyelonephritis",
+                "behandlung": "Antibiotika (z.B. Ciprofloxacin, Cefuroxim) für 7-14 Tage, reichlich Flüssigkeitszufuhr, Analgetika bei Bedarf. Bei schweren Fällen stationäre Aufnahme erwägen.",
+                "abrechnungscode": "N10"
             }
-            enhanced_results["top_diagnose"] = "Pyelonephritis"
-            enhanced_results["behandlung"] = "Antibiotika (z.B. Ciprofloxacin, Cefuroxim) für 7-14 Tage, reichlich Flüssigkeitszufuhr, Analgetika bei Bedarf. Bei schweren Fällen stationäre Aufnahme erwägen."
-            enhanced_results["abrechnungscode"] = "N10"
         else:
-            enhanced_results["diagnosen"] = {
-                "Harnwegsinfektion": 60.0,
-                "Zystitis": 35.0,
-                "Urethritis": 5.0
+            overrides = {
+                "diagnosen": {
+                    "Harnwegsinfektion": 60.0,
+                    "Zystitis": 35.0,
+                    "Urethritis": 5.0
+                },
+                "top_diagnose": "Harnwegsinfektion",
+                "behandlung": "Antibiotika (z.B. Nitrofurantoin, Fosfomycin), reichlich Flüssigkeitszufuhr, ggf. Schmerzmittel. Bei häufiger Wiederkehr erweiterte Diagnostik.",
+                "abrechnungscode": "N30.0"
             }
-            enhanced_results["top_diagnose"] = "Harnwegsinfektion"
-            enhanced_results["behandlung"] = "Antibiotika (z.B. Nitrofurantoin, Fosfomycin), reichlich Flüssigkeitszufuhr, ggf. Schmerzmittel. Bei häufiger Wiederkehr erweiterte Diagnostik."
-            enhanced_results["abrechnungscode"] = "N30.0"
         
-        return enhanced_results
+        return {**ml_results, **overrides}
+    
+    # Kopie der ML-Ergebnisse erstellen; die Diagnosen werden im Folgenden verändert
+    # und müssen daher ebenfalls kopiert werden, damit ml_results unverändert bleibt
+    enhanced_results = dict(ml_results)
+    diagnosen = _DiagTable(ml_results.get("diagnosen", {}))
+    
+    # Alle Symptom-Tokens der Muster in einem Durchlauf über symptom_text ermitteln
+    present_mask = _pattern_token_mask(symptom_text)
+    
+    # Hochspezifische Symptomkonstellationen erkennen
+    for pattern_mask, target_diagnosis in _SPECIFIC_TABLE:
+        if present_mask & pattern_mask == pattern_mask:
+            if target_diagnosis in diagnosen:
+                diagnosen.multiply(target_diagnosis, 2.0)
+                enhanced_results["top_diagnose"] = target_diagnosis
         
     # Schlaganfall-Erkennung mit höherer Konfidenz
     is_stroke_case = (
@@ -613,17 +887,18 @@ def enhance_ml_results(ml_results, llm_results, mimic_results, symptome, vitals_
     
     if is_stroke_case:
         logger.info("Schlaganfallsymptomatik erkannt: Höhere Konfidenz")
-        if "Schlaganfall" in enhanced_results["diagnosen"]:
+        if "Schlaganfall" in diagnosen:
             # Deutlich höhere Gewichtung bei klassischer Symptomatik
-            enhanced_results["diagnosen"]["Schlaganfall"] = max(85.0, enhanced_results["diagnosen"]["Schlaganfall"] * 3.0)
+            diagnosen.set("Schlaganfall", max(85.0, diagnosen["Schlaganfall"] * 3.0))
             enhanced_results["top_diagnose"] = "Schlaganfall"
             enhanced_results["behandlung"] = "NOTFALL: Sofortiger Transport ins Krankenhaus mit Stroke Unit. Zeit ist Hirn! Bildgebung (CT/MRT), evtl. Thrombolyse oder mechanische Thrombektomie."
             enhanced_results["abrechnungscode"] = "I63.9"
             # Reduzierung anderer Diagnosen
-            for diagnose in enhanced_results["diagnosen"]:
-                if diagnose != "Schlaganfall":
-                    enhanced_results["diagnosen"][diagnose] *= 0.3
+            others = np.ones(len(diagnosen.names), dtype=bool)
+            others[diagnosen.index["Schlaganfall"]] = False
+            diagnosen.vals[others] *= 0.3
             
+            enhanced_results["diagnosen"] = diagnosen.to_dict()
             return enhanced_results
     
     # 2. ALLGEMEINE INTEGRATION VON LLM UND ML ERGEBNISSEN
@@ -636,105 +911,101 @@ def enhance_ml_results(ml_results, llm_results, mimic_results, symptome, vitals_
         for diagnosis, probability in llm_diagnoses.items():
             if isinstance(probability, (int, float)) and probability > 0:
                 # Finde übereinstimmende oder ähnliche Diagnose in ML-Ergebnissen
-                ml_match = find_matching_diagnosis(diagnosis, enhanced_results["diagnosen"])
+                ml_match = find_matching_diagnosis(diagnosis, diagnosen.index)
                 
                 if ml_match:
                     # Diagnose existiert bereits - gewichtete Kombination
-                    orig_prob = enhanced_results["diagnosen"][ml_match]
+                    orig_prob = diagnosen[ml_match]
                     # Stärkerer Einfluss der LLM-Diagnose bei hohen Wahrscheinlichkeiten
                     llm_weight = 0.4 + (0.3 * (probability / 100))  # 0.4 bis 0.7 je nach LLM-Konfidenz
-                    enhanced_results["diagnosen"][ml_match] = (orig_prob * (1 - llm_weight)) + (probability * llm_weight)
+                    diagnosen.set(ml_match, (orig_prob * (1 - llm_weight)) + (probability * llm_weight))
                 else:
                     # Neue Diagnose - mit moderater Wahrscheinlichkeit hinzufügen
                     adjusted_prob = min(probability * 0.7, 40.0)  # Max 40% für neue Diagnosen vom LLM
-                    enhanced_results["diagnosen"][diagnosis] = adjusted_prob
+                    diagnosen.set(diagnosis, adjusted_prob)
 
     # 3. MIMIC-BASIERTE ANPASSUNGEN
     
     if mimic_results and len(mimic_results) > 0:
-        logger.info(f"Integriere Informationen aus {len(mimic_results)} ähnlichen MIMIC-Fällen")
-        
-        # Diagnosestatistik aus MIMIC-Fällen
-        mimic_diagnoses = {}
-        for case in mimic_results:
-            for diagnosis in case.get("diagnoses", []):
-                if diagnosis not in mimic_diagnoses:
-                    mimic_diagnoses[diagnosis] = 0
-                # Gewichtung nach Ähnlichkeitsscore
-                mimic_diagnoses[diagnosis] += case.get("similarity_score", 1.0)
+        logger.info("Integriere Informationen aus %d ähnlichen MIMIC-Fällen", len(mimic_results))
         
-        # Top-3 MIMIC-Diagnosen
-        top_mimic_diagnoses = sorted(mimic_diagnoses.items(), key=lambda x: x[1], reverse=True)[:3]
+        # Top-3 MIMIC-Diagnosen (nach Ähnlichkeitsscore gewichtet)
+        top_mimic_diagnoses = mimic.top_k_diagnoses(mimic_results, k=3)
         
         # Integration der MIMIC-Diagnosen mit höherer Gewichtung für übereinstimmende Diagnosen
+        boost_matches = []
+        new_indices = []
         for diagnosis, score in top_mimic_diagnoses:
-            ml_match = find_matching_diagnosis(diagnosis, enhanced_results["diagnosen"])
+            ml_match = find_matching_diagnosis(diagnosis, diagnosen.index)
             
             if ml_match:
-                # Verstärke existierende Diagnose - höhere Verstärkung als zuvor
-                if score > 0.5:  # Wenn mehrere MIMIC-Fälle dieselbe Diagnose haben
-                    boost_factor = 1.0 + (score * 2.0)  # Stärkere Verstärkung
-                else:
-                    boost_factor = 1.0 + (score * 1.5)
-                
-                enhanced_results["diagnosen"][ml_match] *= boost_factor
+                # Verstärkung wird gesammelt und anschließend in einem Schritt angewendet
+                boost_matches.append((ml_match, score))
             elif score > 1.5:  # Nur relevante MIMIC-Diagnosen hinzufügen
-                # Neue Diagnose mit konservativer Wahrscheinlichkeit
-                enhanced_results["diagnosen"][diagnosis] = min(score * 10, 25.0)  # Max 25% für neue MIMIC-Diagnosen
+                # Neue Diagnose mit konservativer Wahrscheinlichkeit (Begrenzung unten)
+                diagnosen.set(diagnosis, score * 10)
+                new_indices.append(diagnosen.index[diagnosis])
+        
+        if new_indices:
+            # Max 25% für neue MIMIC-Diagnosen, in einem Schritt für alle neuen Einträge
+            diagnosen.vals[new_indices] = np.minimum(diagnosen.vals[new_indices], 25.0)
+        
+        if boost_matches:
+            # Verstärke existierende Diagnosen - stärkere Verstärkung, wenn mehrere
+            # MIMIC-Fälle dieselbe Diagnose haben (Score > 0.5), ohne Verzweigung berechnet
+            scores = np.fromiter((score for _, score in boost_matches), dtype=np.float64, count=len(boost_matches))
+            boost_factors = 1.0 + scores * np.where(scores > 0.5, 2.0, 1.5)
+            for (ml_match, _), boost_factor in zip(boost_matches, boost_factors.tolist()):
+                diagnosen.multiply(ml_match, boost_factor)
     
     # 4. KLINISCHE REGELN UND KONTEXTUELLE ANPASSUNGEN
     
     # Altersbasierte Anpassungen
     if alter in ["Säugling", "Kleinkind", "Kind"]:
         # Deutliche Reduzierung unwahrscheinlicher Diagnosen bei Kindern
-        adult_diagnoses = ["Myokardinfarkt", "Akuter Herzinfarkt", "Angina pectoris"]
-        for diag in adult_diagnoses:
-            if diag in enhanced_results["diagnosen"]:
-                enhanced_results["diagnosen"][diag] *= 0.05  # 95% Reduktion
+        for diag in _ADULT_DIAGNOSES.intersection(diagnosen.index):
+            diagnosen.multiply(diag, 0.05)  # 95% Reduktion
     
     # Konfidenzgewichtung für bestimmte kritische Symptomkombinationen
-    critical_patterns = {
-        ("brustschmerzen", "schwitzen", "übelkeit"): ["Akuter Herzinfarkt", 3.0],
-        ("fieber", "husten", "atemnot"): ["Pneumonie", 2.5],
-        ("kopfschmerzen", "fieber", "erbrechen"): ["Meningitis", 2.7],
-        ("bauchschmerzen", "erbrechen", "appetitlosigkeit"): ["Appendizitis", 2.2],
-        ("dyspnoe", "husten", "orthopnoe"): ["Herzinsuffizienz", 2.3]
-    }
-    
-    for pattern, (target_diagnosis, factor) in critical_patterns.items():
+    for pattern_mask, target_diagnosis, factor in _CRITICAL_TABLE:
         # Prüfe, ob alle Symptome im pattern vorhanden sind
-        if all(symptom in symptom_text for symptom in pattern):
-            if target_diagnosis in enhanced_results["diagnosen"]:
-                enhanced_results["diagnosen"][target_diagnosis] *= factor
+        if present_mask & pattern_mask == pattern_mask:
+            if target_diagnosis in diagnosen:
+                diagnosen.multiply(target_diagnosis, factor)
                 # Bei sehr hoher Konfidenz, setze auch top_diagnose
-                if enhanced_results["diagnosen"][target_diagnosis] > 50:
+                if diagnosen[target_diagnosis] > 50:
                     enhanced_results["top_diagnose"] = target_diagnosis
     
     # 5. WAHRSCHEINLICHKEITEN NORMALISIEREN
     
-    # Normalisierung auf 100%
-    total_probability = sum(enhanced_results["diagnosen"].values())
+    # Normalisierung auf 100%, Filterung und Sortierung vektorisiert über das Werte-Array
+    probabilities = diagnosen.vals
+    total_probability = probabilities.sum()
     if total_probability > 0:
-        for diagnosis in enhanced_results["diagnosen"]:
-            enhanced_results["diagnosen"][diagnosis] = round((enhanced_results["diagnosen"][diagnosis] / total_probability) * 100, 1)
+        probabilities = probabilities / total_probability * 100
+        np.round(probabilities, 1, out=probabilities)
     
-    # Entferne unwahrscheinliche Diagnosen
-    enhanced_results["diagnosen"] = {k: v for k, v in enhanced_results["diagnosen"].items() if v >= 2.0}
+    # Sortiere Diagnosen nach Wahrscheinlichkeit (stabil, gleiche Reihenfolge wie sorted)
+    # und entferne unwahrscheinliche Diagnosen; die Filterung erhält die Reihenfolge
+    order = np.argsort(-probabilities, kind="stable")
+    order = order[probabilities[order] >= 2.0]
     
-    # Sortiere Diagnosen nach Wahrscheinlichkeit
-    enhanced_results["diagnosen"] = dict(sorted(enhanced_results["diagnosen"].items(), key=lambda x: x[1], reverse=True))
+    # Ergebnis-Dictionary in einem Durchlauf direkt in sortierter Reihenfolge aufbauen
+    sorted_names = [diagnosen.names[idx] for idx in order.tolist()]
+    sorted_probabilities = probabilities[order].tolist()
+    enhanced_results["diagnosen"] = dict(zip(sorted_names, sorted_probabilities))
     
     # 6. BESTE DIAGNOSE UND BEHANDLUNG FESTLEGEN
     
     # Top-Diagnose setzen mit höherer Konfidenz wenn eine Diagnose deutlich führt
-    if enhanced_results["diagnosen"]:
-        sorted_diagnoses = sorted(enhanced_results["diagnosen"].items(), key=lambda x: x[1], reverse=True)
-        top_diagnosis = sorted_diagnoses[0][0]
-        top_probability = sorted_diagnoses[0][1]
+    # (die Diagnosen sind bereits sortiert, keine erneute Sortierung nötig)
+    if sorted_names:
+        top_diagnosis = sorted_names[0]
+        top_probability = sorted_probabilities[0]
         
         # Wenn eine Diagnose mit über 40% Wahrscheinlichkeit führt und mehr als 
         # 15% vor der nächsten liegt, setze sie mit höherer Konfidenz
-        if top_probability > 40 and (len(sorted_diagnoses) < 2 or top_probability - sorted_diagnoses[1][1] > 15):
+        if top_probability > 40 and (len(sorted_probabilities) < 2 or top_probability - sorted_probabilities[1] > 15):
             enhanced_results["top_diagnose"] = top_diagnosis
             enhanced_results["diagnose_konfidenz"] = "hoch"  # Neue Eigenschaft für Konfidenzwert
         else:
@@ -751,6 +1022,154 @@ def enhance_ml_results(ml_results, llm_results, mimic_results, symptome, vitals_
     
     return enhanced_results
 
+# Cache für LLM-Ergebnisse: nur exakte Treffer über einen normalisierten Fall-Schlüssel
+# (ein ähnlicher Fall, z. B. mit einem zusätzlichen Warnsymptom, braucht eine eigene Antwort)
+_LLM_CACHE_MAXSIZE = 1024
+_llm_cache = OrderedDict()
+_llm_cache_lock = threading.Lock()
+
+def _symptom_tokens(symptome):
+    """Zerlegt eine kommaseparierte Symptomliste in normalisierte Tokens"""
+    return frozenset(s.strip().lower() for s in symptome.split(",") if s.strip())
+
+def _hash_key(*parts):
+    """Bildet einen kompakten Hash-Schlüssel aus mehreren Strings"""
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+def get_llm_results(symptome, vitals_string, alter, zusatz_info, provider, model_type):
+    """
+    Ruft das LLM für einen Fall auf und liefert die geparsten Ergebnisse.
+    Wiederholte Anfragen (gleiche Symptome in beliebiger Reihenfolge, gleiche Vitalparameter,
+    gleiches Alter und gleiche Zusatzinformationen) werden aus dem Cache beantwortet.
+    
+    Returns:
+        dict: Geparste LLM-Ergebnisse oder leeres Dictionary bei Fehlern
+    """
+    tokens = _symptom_tokens(symptome)
+    context_key = _hash_key(vitals_string or "", alter or "", zusatz_info or "", provider, model_type)
+    cache_key = _hash_key("|".join(sorted(tokens)), context_key)
+    
+    with _llm_cache_lock:
+        cached = _llm_cache.get(cache_key)
+        if cached is not None:
+            _llm_cache.move_to_end(cache_key)
+            logger.info("LLM-Ergebnis aus Cache verwendet")
+            return cached
+    
+    # Prompt für LLM erstellen und Anfrage senden
+    prompt = get_medical_prompt(symptome, vitals_string, alter, zusatz_info)
+    llm_response = call_llm_service(prompt, provider, model_type)
+    
+    # Fehlerprüfung
+    if isinstance(llm_response, dict) and "error" in llm_response:
+        logger.warning("LLM-Fehler: %s", llm_response["error"])
+        return {}
+    
+    # LLM-Antwort parsen
+    llm_results = parse_llm_response(llm_response)
+    
+    # Fehlerprüfung beim Parsing
+    if "error" in llm_results:
+        logger.warning("LLM-Parsing-Fehler: %s", llm_results["error"])
+        return {}
+    
+    logger.info("LLM-Integration erfolgreich")
+    
+    # Nur erfolgreiche Ergebnisse zwischenspeichern
+    with _llm_cache_lock:
+        _llm_cache[cache_key] = llm_results
+        if len(_llm_cache) > _LLM_CACHE_MAXSIZE:
+            _llm_cache.popitem(last=False)
+    
+    return llm_results
+
+# Probabilistischer Cache für ähnliche MIMIC-Fälle: nach einem Cache-Miss wird das Ergebnis
+# nur mit Wahrscheinlichkeit _MIMIC_CACHE_PROBABILITY gespeichert (deterministisch über einen
+# Akkumulator), sodass vor allem häufige Anfragen im Cache landen
+_MIMIC_CACHE_MAXSIZE = 512
+_MIMIC_CACHE_PROBABILITY = 0.3
+_mimic_cache = OrderedDict()
+_mimic_cache_accumulator = 0.0
+_mimic_cache_lock = threading.Lock()
+
+def get_mimic_cases(symptome, vitals_string, alter, geschlecht, laborwerte, max_cases=5):
+    """
+    Liefert ähnliche Fälle aus der MIMIC-Datenbank, wenn möglich aus dem Cache.
+    
+    Returns:
+        list: Liste ähnlicher Fälle mit ihren Diagnosen
+    """
+    global _mimic_cache_accumulator
+    
+    cache_key = (
+        tuple(sorted(_symptom_tokens(symptome))),
+        vitals_string or "",
+        alter or "",
+        geschlecht,
+        frozenset((laborwerte or {}).items()),
+        max_cases
+    )
+    
+    with _mimic_cache_lock:
+        cached = _mimic_cache.get(cache_key)
+        if cached is not None:
+            _mimic_cache.move_to_end(cache_key)
+            logger.info("MIMIC-Fälle aus Cache verwendet")
+            return cached
+    
+    mimic_results = mimic.get_similar_cases(symptome, vitals_string, alter, geschlecht, laborwerte, max_cases=max_cases)
+    
+    # Leere Ergebnisse (z.B. nach Fehlern) werden nicht zwischengespeichert
+    if mimic_results:
+        with _mimic_cache_lock:
+            _mimic_cache_accumulator += _MIMIC_CACHE_PROBABILITY
+            if _mimic_cache_accumulator >= 1.0:
+                _mimic_cache_accumulator -= 1.0
+                _mimic_cache[cache_key] = mimic_results
+                if len(_mimic_cache) > _MIMIC_CACHE_MAXSIZE:
+                    _mimic_cache.popitem(last=False)
+    
+    return mimic_results
+
+# Thread-Pool für die parallele MIMIC-Abfrage und LLM-Anfrage in diagnose()
+_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+_MIMIC_TIMEOUT = 60   # Sekunden (die erste Abfrage lädt die MIMIC-Daten)
+_LLM_TIMEOUT = 120    # Sekunden (inkl. Schlüsselrotation und Provider-Fallback)
+
+# Vorkompilierte Muster für das Auslesen der Zusatzinformationen
+_LAB_RE = re.compile(r"laborwerte:\s*(.*?)(?:\n|$)", re.IGNORECASE)
+_SEX_RE = re.compile(r"geschlecht:\s*(.*?)(?:\n|$)", re.IGNORECASE)
+
+# Eindeutige Fälle kommen ohne LLM aus: ML-Top-Diagnose über dieser Wahrscheinlichkeit,
+# höchstens so viele Diagnosen und kein kritisches Symptommuster
+_LLM_SKIP_MIN_PROBABILITY = 70
+_LLM_SKIP_MAX_DIAGNOSES = 3
+
+def _is_clear_ml_case(ml_results, symptom_text):
+    """
+    Prüft, ob das ML-Ergebnis eindeutig genug ist, um auf die LLM-Anfrage zu verzichten.
+    
+    Args:
+        ml_results (dict): ML-Modell Ergebnisse
+        symptom_text (str): Symptome und Zusatzinformationen in Kleinbuchstaben
+        
+    Returns:
+        bool: True, wenn die LLM-Anfrage übersprungen werden kann
+    """
+    diagnosen = ml_results.get("diagnosen") or {}
+    if not diagnosen or len(diagnosen) > _LLM_SKIP_MAX_DIAGNOSES:
+        return False
+    if max(diagnosen.values()) <= _LLM_SKIP_MIN_PROBABILITY:
+        return False
+    
+    # Kritische oder hochspezifische Muster sollen weiterhin vom LLM geprüft werden
+    present_mask = _pattern_token_mask(symptom_text)
+    for table in (_SPECIFIC_TABLE, _CRITICAL_TABLE):
+        for entry in table:
+            if present_mask & entry[0] == entry[0]:
+                return False
+    return True
+
 def diagnose(symptome, vitals_string="", alter="Erwachsener", zusatz_info=""):
     """
     Hauptfunktion für die verbesserte hybride Diagnose (ML + LLM + MIMIC)
@@ -765,84 +1184,81 @@ def diagnose(symptome, vitals_string="", alter="Erwachsener", zusatz_info=""):
         dict: Diagnoseergebnisse und weitere Informationen
     """
     start_time = time.time()
-    logger.info(f"Starte Diagnose für Symptome: {symptome}")
+    logger.info("Starte Diagnose für Symptome: %s", symptome)
     
     # 1. ML-Modell aufrufen
     ml_results = patient_verarbeiten(symptome, vitals_string, alter, zusatz_info)
     
     # 2. Fehlerprüfung des ML-Modells
     if "fehler" in ml_results:
-        logger.warning(f"ML-Modell Fehler: {ml_results['fehler']}")
+        logger.warning("ML-Modell Fehler: %s", ml_results["fehler"])
         return {"result": ml_results, "source": "ml_model"}
     
     # 3. Ähnliche Fälle aus MIMIC-Datenbank abrufen, wenn möglich
-    mimic_results = []
+    #    (läuft im Hintergrund parallel zur LLM-Anfrage)
+    mimic_future = None
+    zusatz_lower = zusatz_info.lower()
     try:
         # Laborwerte aus zusatz_info extrahieren, wenn vorhanden
         laborwerte = {}
-        if "laborwerte:" in zusatz_info.lower():
-            match = re.search(r"laborwerte:\s*(.*?)(?:\n|$)", zusatz_info, re.IGNORECASE)
-            if match:
-                for lab_item in match.group(1).split(","):
-                    if ":" in lab_item:
-                        key, value = lab_item.split(":", 1)
-                        laborwerte[key.strip().lower()] = value.strip()
+        match = _LAB_RE.search(zusatz_info)
+        if match:
+            laborwerte = {
+                key.strip().lower(): value.strip()
+                for key, value in (item.split(":", 1) for item in match.group(1).split(",") if ":" in item)
+            }
         
-        # Geschlecht extrahieren
+        # Geschlecht extrahieren (Teilstring-Prüfungen zuerst, Regex nur bei "Geschlecht:")
         geschlecht = None
-        if "geschlecht:" in zusatz_info.lower() or "weiblich" in zusatz_info.lower() or "männlich" in zusatz_info.lower():
-            if "weiblich" in zusatz_info.lower():
-                geschlecht = "weiblich"
-            elif "männlich" in zusatz_info.lower():
-                geschlecht = "männlich"
-            else:
-                match = re.search(r"geschlecht:\s*(.*?)(?:\n|$)", zusatz_info, re.IGNORECASE)
-                if match:
-                    geschlecht = match.group(1).strip()
-        
-        # MIMIC-Daten abrufen
-        mimic_results = mimic.get_similar_cases(symptome, vitals_string, alter, geschlecht, laborwerte, max_cases=5)
-        logger.info(f"MIMIC: {len(mimic_results)} ähnliche Fälle gefunden")
+        if "weiblich" in zusatz_lower:
+            geschlecht = "weiblich"
+        elif "männlich" in zusatz_lower:
+            geschlecht = "männlich"
+        elif "geschlecht:" in zusatz_lower and (match := _SEX_RE.search(zusatz_info)):
+            geschlecht = match.group(1).strip()
+        
+        # MIMIC-Abfrage starten
+        mimic_future = _EXECUTOR.submit(get_mimic_cases, symptome, vitals_string, alter, geschlecht, laborwerte, max_cases=5)
     except Exception as e:
-        logger.error(f"Fehler bei MIMIC-Integration: {str(e)}")
-        mimic_results = []
+        logger.error("Fehler bei MIMIC-Integration: %s", e)
     
-    # 4. LLM-Unterstützung
-    llm_results = {}
+    # 4. LLM-Unterstützung (ebenfalls im Hintergrund)
+    llm_future = None
     provider, _ = get_available_llm_provider()
     
-    if provider:
+    if provider and _is_clear_ml_case(ml_results, symptome.lower() + " " + zusatz_lower):
+        logger.info("Eindeutiges ML-Ergebnis: LLM-Anfrage wird übersprungen")
+    elif provider:
         try:
-            # Prompt für LLM erstellen
-            prompt = get_medical_prompt(symptome, vitals_string, alter, zusatz_info)
-            
             # Komplexität des Falls bestimmen (für Modellauswahl)
-            is_complex_case = len(symptome.split(",")) > 4 or "laborwerte:" in zusatz_info.lower()
+            is_complex_case = len(symptome.split(",")) > 4 or "laborwerte:" in zusatz_lower
             model_type = "advanced" if is_complex_case else "default"
             
-            # LLM-Anfrage
-            llm_response = call_llm_service(prompt, provider, model_type)
-            
-            # Fehlerprüfung
-            if isinstance(llm_response, dict) and "error" in llm_response:
-                logger.warning(f"LLM-Fehler: {llm_response['error']}")
-                llm_results = {}
-            else:
-                # LLM-Antwort parsen
-                llm_results = parse_llm_response(llm_response)
-                
-                # Fehlerprüfung beim Parsing
-                if "error" in llm_results:
-                    logger.warning(f"LLM-Parsing-Fehler: {llm_results['error']}")
-                    llm_results = {}
-                else:
-                    logger.info("LLM-Integration erfolgreich")
+            # LLM-Anfrage (wiederholte oder sehr ähnliche Fälle kommen aus dem Cache)
+            llm_future = _EXECUTOR.submit(get_llm_results, symptome, vitals_string, alter, zusatz_info, provider, model_type)
         except Exception as e:
-            logger.error(f"Fehler bei LLM-Integration: {str(e)}")
-            llm_results = {}
+            logger.error("Fehler bei LLM-Integration: %s", e)
     else:
         logger.info("Diagnose nur mit ML-Modell (kein LLM-Provider verfügbar)")
     
+    # Auf beide Hintergrundaufgaben warten
+    mimic_results = []
+    if mimic_future is not None:
+        try:
+            mimic_results = mimic_future.result(timeout=_MIMIC_TIMEOUT)
+            logger.info("MIMIC: %d ähnliche Fälle gefunden", len(mimic_results))
+        except Exception as e:
+            logger.error("Fehler bei MIMIC-Integration: %s", e)
+            mimic_results = []
+    
+    llm_results = {}
+    if llm_future is not None:
+        try:
+            llm_results = llm_future.result(timeout=_LLM_TIMEOUT)
+        except Exception as e:
+            logger.error("Fehler bei LLM-Integration: %s", e)
+            llm_results = {}
+    
     # 5. Ergebnisse kombinieren für eine optimierte Diagnose
     try:
         enhanced_results = enhance_ml_results(
@@ -857,13 +1273,13 @@ def diagnose(symptome, vitals_string="", alter="Erwachsener", zusatz_info=""):
         
         # Bearbeitungszeit protokollieren
         processing_time = time.time() - start_time
-        logger.info(f"Hybride Diagnose abgeschlossen in {processing_time:.2f} Sekunden")
+        logger.info("Hybride Diagnose abgeschlossen in %.2f Sekunden", processing_time)
         
         # Quelle der Diagnose angeben
         source = "hybrid"
-        if not provider and not mimic_results:
+        if llm_future is None and not mimic_results:
             source = "ml_model"
-        elif not provider:
+        elif llm_future is None:
             source = "ml_mimic"
         elif not mimic_results:
             source = "ml_llm"
@@ -871,7 +1287,7 @@ def diagnose(symptome, vitals_string="", alter="Erwachsener", zusatz_info=""):
         return {"result": enhanced_results, "source": source}
         
     except Exception as e:
-        logger.error(f"Fehler bei der Ergebnisoptimierung: {str(e)}")
+        logger.error("Fehler bei der Ergebnisoptimierung: %s", e)
         # Fallback auf reine ML-Ergebnisse bei Problemen
         return {"result": ml_results, "source": "ml_model"}
 
@@ -895,12 +1311,17 @@ if __name__ == "__main__":
         }
     ]
     
-    for i, test_fall in enumerate(test_fälle):
+    # Testfälle parallel ausführen (eigener Pool, da diagnose() selbst _EXECUTOR nutzt);
+    # die Ausgabe erfolgt anschließend in der ursprünglichen Reihenfolge
+    with ThreadPoolExecutor(max_workers=len(test_fälle)) as executor:
+        results = list(executor.map(
+            diagnose,
+            [test_fall["symptome"] for test_fall in test_fälle],
+            [test_fall.get("vitals", "") for test_fall in test_fälle],
+            [test_fall.get("alter", "Erwachsener") for test_fall in test_fälle]
+        ))
+    
+    for i, (test_fall, result) in enumerate(zip(test_fälle, results)):
         print(f"\n--- Testfall {i+1}: {test_fall['symptome']} ---")
-        result = diagnose(
-            test_fall["symptome"], 
-            test_fall.get("vitals", ""), 
-            test_fall.get("alter", "Erwachsener")
-        )
-        print(json.dumps(result, indent=2, ensure_ascii=False))
+        print(_json_dumps_pretty(result))
 
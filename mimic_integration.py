@@ -3,9 +3,11 @@
 import pandas as pd
 import numpy as np
 import os
+import re
 import logging
-from sklearn.preprocessing import StandardScaler
-from sklearn.neighbors import NearestNeighbors
+import threading
+import joblib
+from scipy.spatial import cKDTree
 
 # Logger konfigurieren
 logging.basicConfig(
@@ -18,6 +20,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger("mimic_integration")
 
+# Spalten der Vital- und Laborwerttabellen in der Reihenfolge der Features aus _extract_features
+VITAL_COLUMNS = ['heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+                 'temperature', 'respiratory_rate', 'oxygen_saturation']
+LAB_COLUMNS = ['wbc', 'hgb', 'plt', 'crp', 'crea', 'glu']
+
+# Cache der geladenen und indizierten Datenbank (im MIMIC-Verzeichnis); wird verworfen,
+# sobald eine CSV-Datei neuer ist oder sich das Cache-Format/Nachbarschafts-Backend ändert
+CACHE_FILE = '.cache.pkl'
+CACHE_VERSION = 3
+CACHE_ATTRIBUTES = ('patients_df', 'diagnoses_df', 'vitals_df', 'labs_df',
+                    '_vitals_indexed', '_labs_indexed', '_diagnoses_by_patient',
+                    '_feature_means', '_feature_missing', '_scaler_mean', '_scaler_scale',
+                    '_features_scaled', '_tree', '_knn')
+
+# Maximale Wartezeit (Sekunden) einer Anfrage auf die Initialisierung im Hintergrund
+INIT_TIMEOUT = 30
+
+# Bis zu dieser Kohortengröße wird per Brute Force über quadrierte Distanzen gesucht,
+# darüber mit einem cKDTree
+BRUTE_FORCE_MAX_CASES = 50000
+
+# PyArrow-CSV-Parser ist optional (mehrkernig, deutlich schneller bei großen MIMIC-Tabellen)
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+# Vitalparameter-String "HR:80,BP:120/80,..." und Blutdruckwert "120/80"
+_VITALS_RE = re.compile(r'(\w+)\s*:\s*([^,]+)')
+_BP_RE = re.compile(r'\s*(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)\s*$')
+
+# Optional: Intel Extension for Scikit-learn (oneDAL, SIMD-Distanzkernel) für große Kohorten,
+# aktiviert über PRAXISPRO_USE_SKLEARNEX=1; sonst wird der cKDTree verwendet
+SklearnexNearestNeighbors = None
+if os.getenv("PRAXISPRO_USE_SKLEARNEX") == "1":
+    try:
+        from sklearnex.neighbors import NearestNeighbors as SklearnexNearestNeighbors
+        logger.info("sklearnex aktiviert: Nächste-Nachbarn-Suche über oneDAL.")
+    except ImportError:
+        logger.warning("PRAXISPRO_USE_SKLEARNEX=1, aber sklearnex ist nicht installiert.")
+
 class MIMICIntegration:
     """
     Klasse zur Integration mit PhysioNet-MIMIC Datenbank für erweitertes Reasoning bei Diagnosen.
@@ -36,9 +80,32 @@ class MIMICIntegration:
         self.diagnoses_df = None
         self.vitals_df = None
         self.labs_df = None
+        self._vitals_indexed = None
+        self._labs_indexed = None
+        self._diagnoses_by_patient = {}
+        self._feature_means = None
+        self._feature_missing = None
+        self._scaler_mean = None
+        self._scaler_scale = None
+        self._features_scaled = None
+        self._tree = None
+        self._knn = None
         self.symptom_mapper = self._create_symptom_mapper()
         self.is_initialized = False
         
+        # Datenbank im Hintergrund laden, damit nicht die erste Anfrage das Einlesen
+        # der CSV-Dateien und den Aufbau des Nachbarschaftsindex bezahlt
+        self._init_lock = threading.Lock()
+        self._ready = threading.Event()
+        threading.Thread(target=self._initialize_in_background, name="mimic-init", daemon=True).start()
+    
+    def _initialize_in_background(self):
+        """Initialisiert die Datenbank im Hintergrund-Thread und signalisiert danach Bereitschaft"""
+        try:
+            self.initialize_database()
+        finally:
+            self._ready.set()
+        
     def _create_symptom_mapper(self):
         """Erstellt eine Mapping-Tabelle von deutschen Symptomen zu englischen ICD-Codes"""
         # Basiskonvertierung von häufigen Symptomen zu ICD-Codes
@@ -72,9 +139,14 @@ class MIMICIntegration:
         Returns:
             bool: True, wenn die Initialisierung erfolgreich war, sonst False.
         """
-        if self.is_initialized and not force_reload:
-            return True
-            
+        # Gleichzeitige Aufrufe (Hintergrund-Thread und Anfragen) laden die Daten nur einmal
+        with self._init_lock:
+            if self.is_initialized and not force_reload:
+                return True
+            return self._load_database(force_reload)
+    
+    def _load_database(self, force_reload):
+        """Lädt Daten, Indizes und Nachbarschaftsindex (Aufruf nur unter _init_lock)"""
         try:
             # Versuche, MIMIC-Dateien zu laden, wenn vorhanden
             # Hier verwenden wir stark vereinfachte Versionen der MIMIC-Tabellen
@@ -83,17 +155,31 @@ class MIMICIntegration:
             diagnoses_file = os.path.join(self.mimic_dir, 'diagnoses.csv')
             vitals_file = os.path.join(self.mimic_dir, 'vitals.csv')
             labs_file = os.path.join(self.mimic_dir, 'labs.csv')
+            data_files = [patient_file, diagnoses_file, vitals_file, labs_file]
+            cache_file = os.path.join(self.mimic_dir, CACHE_FILE)
             
             # Prüfen, ob Dateien existieren
-            if not all(os.path.exists(f) for f in [patient_file, diagnoses_file, vitals_file, labs_file]):
+            use_data_files = all(os.path.exists(f) for f in data_files)
+            if not use_data_files:
                 logger.warning("Nicht alle benötigten MIMIC-Datendateien gefunden.")
                 self._setup_mock_data()  # Erstellt Mock-Daten für Testzwecke
+            elif not force_reload and self._load_cache(cache_file, data_files):
+                self.is_initialized = True
+                logger.info("MIMIC-Integration aus Cache initialisiert.")
+                return True
             else:
-                # Lade echte MIMIC-Daten
-                self.patients_df = pd.read_csv(patient_file)
-                self.diagnoses_df = pd.read_csv(diagnoses_file)
-                self.vitals_df = pd.read_csv(vitals_file)
-                self.labs_df = pd.read_csv(labs_file)
+                # Lade echte MIMIC-Daten (nur die in diesem Modul verwendeten Spalten)
+                self.patients_df = self._read_csv(patient_file, ['patient_id', 'age', 'gender'],
+                                                  dtype={'gender': 'category'})
+                self.diagnoses_df = self._read_csv(diagnoses_file, ['patient_id', 'diagnosis'])
+                self.vitals_df = self._read_csv(vitals_file, ['patient_id'] + VITAL_COLUMNS)
+                self.labs_df = self._read_csv(labs_file, ['patient_id'] + LAB_COLUMNS)
+            
+            self._index_tables()
+            self._fit_neighbors()
+            
+            if use_data_files:
+                self._save_cache(cache_file)
             
             self.is_initialized = True
             logger.info("MIMIC-Integration erfolgreich initialisiert.")
@@ -103,6 +189,60 @@ class MIMICIntegration:
             logger.error(f"Fehler bei der Initialisierung der MIMIC-Integration: {str(e)}")
             return False
     
+    def _cache_key(self):
+        """Kennung von Cache-Format und Nachbarschafts-Backend"""
+        return (CACHE_VERSION, 'sklearnex' if SklearnexNearestNeighbors is not None else 'ckdtree')
+    
+    def _load_cache(self, cache_file, data_files):
+        """
+        Stellt Tabellen, Indizes und Nachbarschaftsindex aus dem Cache wieder her.
+        
+        Returns:
+            bool: True, wenn ein gültiger Cache geladen wurde
+        """
+        if not os.path.exists(cache_file):
+            return False
+        if os.path.getmtime(cache_file) < max(os.path.getmtime(f) for f in data_files):
+            return False
+        try:
+            cached = joblib.load(cache_file)
+            if cached.get('key') != self._cache_key():
+                return False
+            for attribute in CACHE_ATTRIBUTES:
+                setattr(self, attribute, cached[attribute])
+            return True
+        except Exception as e:
+            logger.warning(f"MIMIC-Cache konnte nicht geladen werden: {str(e)}")
+            return False
+    
+    def _save_cache(self, cache_file):
+        """Speichert Tabellen, Indizes und Nachbarschaftsindex für den nächsten Start"""
+        try:
+            cached = {attribute: getattr(self, attribute) for attribute in CACHE_ATTRIBUTES}
+            cached['key'] = self._cache_key()
+            joblib.dump(cached, cache_file, compress=3)
+        except Exception as e:
+            logger.warning(f"MIMIC-Cache konnte nicht gespeichert werden: {str(e)}")
+    
+    def _read_csv(self, path, columns, dtype=None):
+        """
+        Liest eine MIMIC-CSV-Datei und lädt nur die angegebenen Spalten, soweit vorhanden.
+        
+        Args:
+            path (str): Pfad zur CSV-Datei
+            columns (list): Benötigte Spalten
+            dtype (dict): Optionale Datentypen je Spalte
+        
+        Returns:
+            pd.DataFrame: Geladene Tabelle
+        """
+        # Kopfzeile vorab lesen, da usecols bei fehlenden Spalten einen Fehler auslöst
+        available = set(pd.read_csv(path, nrows=0).columns)
+        usecols = [column for column in columns if column in available]
+        if dtype:
+            dtype = {column: value for column, value in dtype.items() if column in available}
+        return pd.read_csv(path, engine=CSV_ENGINE, usecols=usecols, dtype=dtype or None)
+    
     def _setup_mock_data(self):
         """Erstellt Mock-Daten für Testzwecke, wenn keine MIMIC-Dateien gefunden werden."""
         # Mock-Patientendaten
@@ -114,49 +254,159 @@ class MIMICIntegration:
             'height': np.random.normal(170, 10, 100)
         })
         
-        # Mock-Diagnosedaten
-        diagnoses = []
-        for i in range(1, 101):
-            num_diagnoses = np.random.randint(1, 5)
-            for j in range(num_diagnoses):
-                diagnoses.append({
-                    'patient_id': i,
-                    'icd_code': np.random.choice(['I21.9', 'J18.9', 'K35.80', 'N39.0', 'R07.9', 'J44.9', 'E11.9']),
-                    'diagnosis': np.random.choice(['Myokardinfarkt', 'Pneumonie', 'Appendizitis', 'Harnwegsinfektion', 
-                                                  'Brustschmerzen', 'COPD', 'Diabetes mellitus Typ 2'])
-                })
-        self.diagnoses_df = pd.DataFrame(diagnoses)
+        # Mock-Diagnosedaten (1-4 Diagnosen pro Patient, spaltenweise erzeugt)
+        num_diagnoses = np.random.randint(1, 5, 100)
+        diagnosis_patient_ids = np.repeat(np.arange(1, 101), num_diagnoses)
+        self.diagnoses_df = pd.DataFrame({
+            'patient_id': diagnosis_patient_ids,
+            'icd_code': np.random.choice(['I21.9', 'J18.9', 'K35.80', 'N39.0', 'R07.9', 'J44.9', 'E11.9'],
+                                         diagnosis_patient_ids.size),
+            'diagnosis': np.random.choice(['Myokardinfarkt', 'Pneumonie', 'Appendizitis', 'Harnwegsinfektion', 
+                                           'Brustschmerzen', 'COPD', 'Diabetes mellitus Typ 2'],
+                                          diagnosis_patient_ids.size)
+        })
         
         # Mock-Vitalparameter
-        vitals = []
-        for i in range(1, 101):
-            vitals.append({
-                'patient_id': i,
-                'heart_rate': np.random.normal(80, 15),
-                'blood_pressure_systolic': np.random.normal(120, 20),
-                'blood_pressure_diastolic': np.random.normal(80, 10),
-                'temperature': np.random.normal(37, 1),
-                'respiratory_rate': np.random.normal(16, 2),
-                'oxygen_saturation': np.random.normal(97, 2)
-            })
-        self.vitals_df = pd.DataFrame(vitals)
+        self.vitals_df = pd.DataFrame({
+            'patient_id': range(1, 101),
+            'heart_rate': np.random.normal(80, 15, 100),
+            'blood_pressure_systolic': np.random.normal(120, 20, 100),
+            'blood_pressure_diastolic': np.random.normal(80, 10, 100),
+            'temperature': np.random.normal(37, 1, 100),
+            'respiratory_rate': np.random.normal(16, 2, 100),
+            'oxygen_saturation': np.random.normal(97, 2, 100)
+        })
         
         # Mock-Laborwerte
-        labs = []
-        for i in range(1, 101):
-            labs.append({
-                'patient_id': i,
-                'wbc': np.random.normal(8, 2),  # Leukozyten
-                'hgb': np.random.normal(14, 2),  # Hämoglobin
-                'plt': np.random.normal(250, 50),  # Thrombozyten
-                'crp': np.random.exponential(5),  # CRP
-                'crea': np.random.normal(1, 0.2),  # Kreatinin
-                'glu': np.random.normal(100, 20)  # Glukose
-            })
-        self.labs_df = pd.DataFrame(labs)
+        self.labs_df = pd.DataFrame({
+            'patient_id': range(1, 101),
+            'wbc': np.random.normal(8, 2, 100),  # Leukozyten
+            'hgb': np.random.normal(14, 2, 100),  # Hämoglobin
+            'plt': np.random.normal(250, 50, 100),  # Thrombozyten
+            'crp': np.random.exponential(5, 100),  # CRP
+            'crea': np.random.normal(1, 0.2, 100),  # Kreatinin
+            'glu': np.random.normal(100, 20, 100)  # Glukose
+        })
         
         logger.info("Mock-Daten für MIMIC-Integration erstellt.")
     
+    def _index_tables(self):
+        """
+        Indiziert Vital- und Laborwerte einmalig nach patient_id
+        (pro Patient wird wie bisher der erste Eintrag verwendet) und
+        gruppiert die Diagnosen pro Patient.
+        """
+        self._vitals_indexed = (self.vitals_df.drop_duplicates('patient_id')
+                                .set_index('patient_id')
+                                .reindex(columns=VITAL_COLUMNS))
+        self._labs_indexed = (self.labs_df.drop_duplicates('patient_id')
+                              .set_index('patient_id')
+                              .reindex(columns=LAB_COLUMNS))
+        self._diagnoses_by_patient = {
+            patient_id: group.tolist()
+            for patient_id, group in self.diagnoses_df.groupby('patient_id', sort=False)['diagnosis']
+        }
+    
+    def _build_feature_columns(self):
+        """
+        Erstellt die Features aller MIMIC-Patienten spaltenweise (ein Array pro Feature, eine
+        Zeile pro Patient in der Reihenfolge von patients_df) über vektorisierte Joins.
+        Die klinischen Werte brauchen keine doppelte Genauigkeit, daher float32.
+        
+        Returns:
+            list: float32-Arrays für Alter, Geschlecht, Vital- und Laborwerte (NaN für fehlende Werte)
+        """
+        patient_ids = self.patients_df['patient_id']
+        vitals = self._vitals_indexed.reindex(patient_ids)
+        labs = self._labs_indexed.reindex(patient_ids)
+        return (
+            [self.patients_df['age'].to_numpy(dtype=np.float32),
+             (self.patients_df['gender'] == 'M').to_numpy(dtype=np.float32)] +
+            [vitals[column].to_numpy(dtype=np.float32) for column in VITAL_COLUMNS] +
+            [labs[column].to_numpy(dtype=np.float32) for column in LAB_COLUMNS]
+        )
+    
+    def _fit_neighbors(self):
+        """
+        Standardisiert die Features und baut den Nachbarschaftsindex einmalig auf,
+        da sich die MIMIC-Kohorte nach der Initialisierung nicht mehr ändert.
+        """
+        columns = self._build_feature_columns()
+        
+        means, missing, centers, scales = [], [], [], []
+        for position, column in enumerate(columns):
+            # Fehlende Werte durch den Spaltenmittelwert ersetzen; Spalten ganz ohne Werte
+            # (z.B. keine Atemfrequenz in den CSV-Daten) werden für alle Fälle auf 0 gesetzt
+            nan_mask = np.isnan(column)
+            is_missing = bool(nan_mask.all())
+            mean = np.float32(0.0 if is_missing else column[~nan_mask].mean(dtype=np.float64))
+            column = np.where(nan_mask, mean, column)
+            
+            # Standardisierung (wie StandardScaler: Mittelwert 0, Standardabweichung 1,
+            # konstante Spalten behalten die Skala 1)
+            center = column.mean(dtype=np.float64)
+            scale = column.std(dtype=np.float64)
+            if scale < 10 * np.finfo(np.float64).eps:
+                scale = 1.0
+            center, scale = np.float32(center), np.float32(scale)
+            columns[position] = (column - center) / scale
+            
+            means.append(mean)
+            missing.append(is_missing)
+            centers.append(center)
+            scales.append(scale)
+        
+        # Parameter als float32-Arrays, damit Abfragen ohne die Validierungsschicht
+        # von scikit-learn auskommen
+        self._feature_means = np.array(means, dtype=np.float32)
+        self._feature_missing = np.array(missing, dtype=bool)
+        self._scaler_mean = np.array(centers, dtype=np.float32)
+        self._scaler_scale = np.array(scales, dtype=np.float32)
+        
+        # Einmaliges Zusammenfügen der Spalten zur Matrix (eine Zeile pro Patient)
+        all_features_scaled = np.stack(columns, axis=1)
+        
+        self._features_scaled = self._tree = self._knn = None
+        if SklearnexNearestNeighbors is not None:
+            self._knn = SklearnexNearestNeighbors().fit(all_features_scaled)
+        elif len(all_features_scaled) <= BRUTE_FORCE_MAX_CASES:
+            self._features_scaled = all_features_scaled
+        else:
+            self._tree = cKDTree(all_features_scaled, balanced_tree=False, compact_nodes=True)
+    
+    def _query_neighbors(self, features_scaled, k):
+        """
+        Sucht die k nächsten MIMIC-Patienten zu einem standardisierten Featurevektor.
+        
+        Returns:
+            tuple: (Distanzen, Zeilenindizes in patients_df), jeweils eindimensional
+        """
+        if self._knn is not None:
+            distances, indices = self._knn.kneighbors(features_scaled.reshape(1, -1), n_neighbors=k)
+            return distances[0], indices[0]
+        
+        if self._features_scaled is not None:
+            # Rangfolge über quadrierte euklidische Distanzen; die Wurzel wird nur
+            # für die k ausgewählten Fälle (Ähnlichkeitsscore) berechnet
+            diff = self._features_scaled - features_scaled
+            squared_distances = np.einsum('ij,ij->i', diff, diff)
+            
+            # k-kleinste Distanz per Partitionierung (O(N)); alle Zeilen bis zu dieser Distanz
+            # (inklusive aller Gleichstände an der Grenze) werden nach Distanz und Zeilenindex
+            # sortiert, sodass die Auswahl einer stabilen Sortierung entspricht
+            if k < len(squared_distances):
+                kth_distance = np.partition(squared_distances, k - 1)[k - 1]
+                indices = np.flatnonzero(squared_distances <= kth_distance)
+            else:
+                indices = np.arange(len(squared_distances))
+            indices = indices[np.lexsort((indices, squared_distances[indices]))][:k]
+            return np.sqrt(squared_distances[indices]), indices
+        
+        # cKDTree ist bei Einzelabfragen deutlich schneller als NearestNeighbors;
+        # bei k=1 liefert query Skalare, daher atleast_1d
+        distances, indices = self._tree.query(features_scaled, k=k)
+        return np.atleast_1d(distances), np.atleast_1d(indices)
+    
     def get_similar_cases(self, symptome=None, vitals=None, alter=None, geschlecht=None, laborwerte=None, max_cases=5):
         """
         Findet ähnliche Fälle aus der MIMIC-Datenbank basierend auf den klinischen Parametern.
@@ -173,7 +423,11 @@ class MIMICIntegration:
             list: Liste ähnlicher Fälle mit ihren Diagnosen
         """
         if not self.is_initialized:
-            self.initialize_database()
+            self._ready.wait(timeout=INIT_TIMEOUT)
+            
+            # Ist die Initialisierung im Hintergrund fehlgeschlagen, erneut versuchen
+            if not self.is_initialized and self._ready.is_set():
+                self.initialize_database()
             
         if not self.is_initialized:
             logger.error("MIMIC-Datenbank konnte nicht initialisiert werden.")
@@ -183,87 +437,32 @@ class MIMICIntegration:
             # Feature-Extraktion aus den Patientendaten
             current_features = self._extract_features(symptome, vitals, alter, geschlecht, laborwerte)
             
-            # Feature-Extraktion für alle MIMIC-Patienten
-            all_patients_features = []
-            for idx, patient in self.patients_df.iterrows():
-                patient_id = patient['patient_id']
-                
-                # Vitalparameter für diesen Patienten abrufen
-                patient_vitals = self.vitals_df[self.vitals_df['patient_id'] == patient_id].iloc[0] if len(self.vitals_df[self.vitals_df['patient_id'] == patient_id]) > 0 else None
-                
-                # Laborwerte für diesen Patienten abrufen
-                patient_labs = self.labs_df[self.labs_df['patient_id'] == patient_id].iloc[0] if len(self.labs_df[self.labs_df['patient_id'] == patient_id]) > 0 else None
-                
-                # Features für diesen Patienten extrahieren
-                patient_features = []
-                
-                # Alter
-                patient_features.append(patient['age'])
-                
-                # Geschlecht (binär kodiert)
-                patient_features.append(1 if patient['gender'] == 'M' else 0)
-                
-                # Vitalparameter
-                if patient_vitals is not None:
-                    patient_features.extend([
-                        patient_vitals['heart_rate'],
-                        patient_vitals['blood_pressure_systolic'],
-                        patient_vitals['blood_pressure_diastolic'],
-                        patient_vitals['temperature'],
-                        patient_vitals['respiratory_rate'],
-                        patient_vitals['oxygen_saturation']
-                    ])
-                else:
-                    patient_features.extend([np.nan] * 6)
-                
-                # Laborwerte
-                if patient_labs is not None:
-                    patient_features.extend([
-                        patient_labs['wbc'],
-                        patient_labs['hgb'],
-                        patient_labs['plt'],
-                        patient_labs['crp'],
-                        patient_labs['crea'],
-                        patient_labs['glu']
-                    ])
-                else:
-                    patient_features.extend([np.nan] * 6)
-                
-                all_patients_features.append(patient_features)
-            
-            # DataFrame mit allen Patientenfeatures erstellen
-            all_features_df = pd.DataFrame(all_patients_features)
-            
-            # Fehlende Werte durch Mittelwerte ersetzen
-            all_features_df.fillna(all_features_df.mean(), inplace=True)
-            current_features_array = np.array(current_features).reshape(1, -1)
-            current_features_df = pd.DataFrame(current_features_array)
-            current_features_df.fillna(all_features_df.mean(), inplace=True)
+            # Fehlende Werte durch die Mittelwerte der MIMIC-Kohorte ersetzen
+            current_features_array = np.array(current_features, dtype=np.float32).reshape(1, -1)
+            current_features_array = np.where(np.isnan(current_features_array) | self._feature_missing,
+                                              self._feature_means, current_features_array)
             
-            # Standardisierung der Features
-            scaler = StandardScaler()
-            all_features_scaled = scaler.fit_transform(all_features_df)
-            current_features_scaled = scaler.transform(current_features_df)
+            # Standardisierung mit den bei der Initialisierung bestimmten Parametern
+            current_features_scaled = (current_features_array - self._scaler_mean) / self._scaler_scale
             
             # Nächste Nachbarn finden
-            knn = NearestNeighbors(n_neighbors=min(max_cases, len(all_features_scaled)))
-            knn.fit(all_features_scaled)
-            distances, indices = knn.kneighbors(current_features_scaled)
+            distances, indices = self._query_neighbors(current_features_scaled[0], min(max_cases, len(self.patients_df)))
             
-            # Ähnliche Fälle und ihre Diagnosen extrahieren
-            similar_cases = []
-            for i, idx in enumerate(indices[0]):
-                patient_id = self.patients_df.iloc[idx]['patient_id']
-                diagnoses = self.diagnoses_df[self.diagnoses_df['patient_id'] == patient_id]
-                
-                case = {
+            # Ähnliche Fälle und ihre Diagnosen extrahieren (ein gemeinsamer Zugriff auf alle Nachbarn)
+            neighbors = self.patients_df.take(indices)
+            similarity_scores = 1.0 / (1.0 + distances)  # Normalisierte Ähnlichkeit
+            similar_cases = [
+                {
                     'patient_id': int(patient_id),
-                    'similarity_score': 1.0 / (1.0 + distances[0][i]),  # Normalisierte Ähnlichkeit
-                    'age': int(self.patients_df.iloc[idx]['age']),
-                    'gender': self.patients_df.iloc[idx]['gender'],
-                    'diagnoses': diagnoses['diagnosis'].tolist() if not diagnoses.empty else []
+                    'similarity_score': float(similarity_score),
+                    'age': int(age),
+                    'gender': gender,
+                    'diagnoses': list(self._diagnoses_by_patient.get(patient_id, ()))
                 }
-                similar_cases.append(case)
+                for patient_id, age, gender, similarity_score in zip(
+                    neighbors['patient_id'].tolist(), neighbors['age'].tolist(),
+                    neighbors['gender'].tolist(), similarity_scores.tolist())
+            ]
             
             return similar_cases
             
@@ -304,23 +503,16 @@ class MIMICIntegration:
         features.append(geschlecht_numeric)
         
         # Vitalparameter
-        vitals_dict = {}
-        if vitals:
-            for pair in vitals.split(','):
-                if ':' in pair:
-                    key, value = pair.split(':', 1)
-                    vitals_dict[key.strip()] = value.strip()
+        vitals_dict = {key: value.strip() for key, value in _VITALS_RE.findall(vitals)} if vitals else {}
         
         # Standardwerte für fehlende Vitalparameter
         hr = float(vitals_dict.get('HR', 80))
         
         # Blutdruck extrahieren (systolisch und diastolisch)
         bp_sys, bp_dia = 120, 80
-        if 'BP' in vitals_dict and '/' in vitals_dict['BP']:
-            try:
-                bp_sys, bp_dia = map(float, vitals_dict['BP'].split('/'))
-            except ValueError:
-                pass
+        bp_match = _BP_RE.match(vitals_dict.get('BP', ''))
+        if bp_match:
+            bp_sys, bp_dia = float(bp_match.group(1)), float(bp_match.group(2))
         
         temp = float(vitals_dict.get('T', 37.0))
         spo2 = float(vitals_dict.get('SpO2', 97))
@@ -349,6 +541,9 @@ class MIMICIntegration:
         Mit verstärkter Gewichtung für übereinstimmende Diagnosen und höherer Konfidenz
         bei mehrfacher Bestätigung durch die Datenbank.
         
+        Hinweis: Wird derzeit nicht aufgerufen; hybrid_model.enhance_ml_results führt die
+        MIMIC-Ergebnisse selbst (über top_k_diagnoses) mit den Diagnosen zusammen.
+        
         Args:
             diagnosen (dict): Dictionary mit Diagnosen und Wahrscheinlichkeiten
             similar_cases (list): Liste ähnlicher Fälle aus der MIMIC-Datenbank
@@ -421,7 +616,43 @@ class MIMICIntegration:
                 adjusted_diagnosen[diagnosis] = round((adjusted_diagnosen[diagnosis] / total) * 100, 1)
         
         return adjusted_diagnosen
-    
+
+    def top_k_diagnoses(self, similar_cases, k=3):
+        """
+        Aggregiert die Ähnlichkeitsscores pro Diagnose über alle ähnlichen Fälle
+        und liefert die k Diagnosen mit dem höchsten Gesamtscore.
+
+        Args:
+            similar_cases (list): Liste ähnlicher Fälle aus get_similar_cases
+            k (int): Anzahl zurückzugebender Diagnosen
+
+        Returns:
+            list: Liste von (Diagnose, Score)-Tupeln, absteigend nach Score sortiert
+        """
+        # Diagnosen in Reihenfolge des ersten Auftretens indizieren
+        index = {}
+        diagnosis_ids = []
+        weights = []
+        for case in similar_cases:
+            similarity = case.get("similarity_score", 1.0)
+            for diagnosis in case.get("diagnoses", []):
+                diagnosis_ids.append(index.setdefault(diagnosis, len(index)))
+                weights.append(similarity)
+
+        if not index:
+            return []
+
+        # Gewichtete Summe pro Diagnose in einem Durchlauf
+        scores = np.bincount(diagnosis_ids, weights=weights, minlength=len(index))
+        names = list(index)
+
+        # Top-k per stabiler Sortierung: bei gleichem Score bleibt die Reihenfolge des
+        # ersten Auftretens erhalten (gleiche Scores sind häufig, da alle Diagnosen eines
+        # Falls dasselbe Gewicht bekommen; die Anzahl der Diagnosen ist klein)
+        top = np.argsort(-scores, kind="stable")[:k]
+
+        return [(names[i], float(scores[i])) for i in top]
+
     def _normalize_diagnosis_name(self, diagnosis):
         """Normalisiert Diagnosenamen für besseren Vergleich"""
         diagnosis = diagnosis.lower()
@@ -4,24 +4,90 @@ Generiert realistische medizinische Fälle basierend auf häufigen Diagnosegrupp
 """
 
 import json
+import csv
+import re
 import time
 import os
-import pandas as pd
+import asyncio
+import contextlib
+import tempfile
+import hashlib
+import sqlite3
+import functools
 import random
 from datetime import datetime
 import logging
+import logging.handlers
+import queue
+import atexit
 from dotenv import load_dotenv
-from openai import OpenAI
+import openai
+from openai import OpenAI, AsyncOpenAI
+from pydantic import BaseModel, ConfigDict
+
+# orjson ist optional und deutlich schneller als das json-Modul;
+# orjson.JSONDecodeError ist eine Unterklasse von json.JSONDecodeError
+try:
+    import orjson
+    _json_loads = orjson.loads
+    
+    def _json_dumps(obj, sort_keys=False):
+        """Kompakte JSON-Ausgabe (UTF-8, optional mit sortierten Schlüsseln)"""
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    
+    def _json_dumps_pretty(obj):
+        """Formatierte JSON-Ausgabe (UTF-8, Einrückung 2)"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+    
+    def _json_dumps(obj, sort_keys=False):
+        """Kompakte JSON-Ausgabe (UTF-8, optional mit sortierten Schlüsseln)"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys)
+    
+    def _json_dumps_pretty(obj):
+        """Formatierte JSON-Ausgabe (UTF-8, Einrückung 2)"""
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+
+# pyarrow ist optional; wenn vorhanden, werden die Tabellen zusätzlich als Parquet (zstd) gespeichert
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# pybloom_live ist optional (Bloom-Filter mit festem Speicherbedarf für die Duplikaterkennung);
+# ohne das Paket wird eine Menge der Signaturen verwendet
+try:
+    from pybloom_live import ScalableBloomFilter
+except ImportError:
+    ScalableBloomFilter = None
+
+# aiolimiter ist optional (Token-Bucket über die Anfragen pro Minute); ohne das Paket
+# begrenzen nur MAX_GENERATION_CONCURRENCY/MAX_VALIDATION_CONCURRENCY die gleichzeitigen API-Aufrufe
+try:
+    from aiolimiter import AsyncLimiter
+except ImportError:
+    AsyncLimiter = None
 
 # Logging konfigurieren
+# Log-Ausgabe über eine Queue: Die Datei- und Konsolenausgabe übernimmt ein Hintergrund-Thread,
+# damit die Generierung nicht auf Schreibvorgänge wartet. Die Formatierung erfolgt bereits im QueueHandler.
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(
+    _log_queue,
+    logging.FileHandler("synthetic_generator.log", delay=True),
+    logging.StreamHandler()
+)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("synthetic_generator.log"),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger("synthetic_generator")
 
 # Umgebungsvariablen laden
@@ -31,6 +97,57 @@ load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 client = OpenAI(api_key=api_key)
 
+def create_async_client():
+    """
+    Erstellt einen asynchronen OpenAI-Client. Sein Verbindungspool ist an die Ereignisschleife
+    gebunden, daher bekommt jeder asyncio.run-Aufruf einen eigenen Client (als async-Kontextmanager).
+    Die eingebauten Wiederholungen des Clients sind abgeschaltet, das übernimmt _retry_api_call.
+    """
+    return AsyncOpenAI(api_key=api_key, max_retries=0)
+
+# Wiederholung von API-Aufrufen bei Rate-Limits und Verbindungsfehlern
+# (exponentielles Backoff mit zufälliger Wartezeit, in Sekunden)
+API_MAX_ATTEMPTS = 6
+API_BACKOFF_MIN = 1.0
+API_BACKOFF_MAX = 60.0
+RETRYABLE_API_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)
+
+# Signaturen (Enddiagnose + sortierte Symptome) bereits vorhandener Fälle zur Duplikaterkennung
+_seen_cases = None
+
+# Cache der Validierungsergebnisse im Ausgabeverzeichnis (Schlüssel: Hash des Fall-JSON)
+VALIDATION_CACHE_FILE = '.validation_cache.sqlite'
+_validation_cache = None  # sqlite3-Verbindung, geöffnet über open_validation_cache
+
+# Anzahl der Fälle, die in einer Anfrage gemeinsam generiert werden
+CASES_PER_REQUEST = 5
+
+# Abbruch einer Kategorie nach so vielen abgelehnten Fällen in Folge; Warnung bei niedrigerer Akzeptanzrate
+MAX_REJECTION_STREAK = 5
+MIN_ACCEPTANCE_RATE = 0.5
+
+# Abbruch einer Kategorie nach so vielen unbrauchbaren Fällen in Folge (API-Fehler, Verweigerungen,
+# fehlende Fälle in der Antwort, Duplikate); diese zählen nicht als Ablehnung durch die Validierung
+MAX_GENERATION_FAILURES = 3 * CASES_PER_REQUEST
+
+# Ergebnis der Verarbeitung eines angeforderten Falls
+CASE_ACCEPTED = "accepted"
+CASE_REJECTED = "rejected"
+CASE_FAILED = "failed"
+
+# Abfrageintervall (Sekunden) für den Status von Batch-API-Aufträgen
+BATCH_POLL_INTERVAL = 30
+
+# Modelle für Generierung und Validierung (überschreibbar über Umgebungsvariablen)
+GEN_MODEL = os.getenv("GEN_MODEL", "gpt-4o-mini")
+JUDGE_MODEL = os.getenv("JUDGE_MODEL", "gpt-4o-mini")
+
+# Maximale Anzahl gleichzeitiger Generierungs- und Validierungsanfragen (getrennt einstellbar,
+# die kürzeren Validierungsanfragen brauchen weniger parallele Plätze) und API-Aufrufe pro Minute
+MAX_GENERATION_CONCURRENCY = 10
+MAX_VALIDATION_CONCURRENCY = 5
+REQUESTS_PER_MINUTE = 60
+
 # Prüfen, ob API-Schlüssel geladen wurde
 if not api_key:
     logger.error("Kein OpenAI API-Schlüssel gefunden. Bitte stelle sicher, dass der Schlüssel in der .env Datei korrekt gesetzt ist.")
@@ -107,151 +224,307 @@ CASE_CATEGORIES = {
     }
 }
 
-def create_case_prompt(category_key):
-    """Erstellt einen detaillierten Prompt für die Generierung eines medizinischen Falls"""
+# Antwortstrukturen für Structured Outputs: die API liefert garantiert schema-konformes JSON
+# (keine Markdown-Formatierung, keine fehlenden Felder)
+class Case(BaseModel):
+    """Generierter medizinischer Fall"""
+    model_config = ConfigDict(extra="forbid")
+    
+    id: str
+    alter: int
+    geschlecht: str
+    symptome: list[str]
+    vitalparameter: str
+    vorerkrankungen: list[str]
+    vorherige_operationen: list[str]
+    befunde: str
+    enddiagnose: str
+
+class CaseList(BaseModel):
+    """Mehrere generierte Fälle einer Anfrage"""
+    model_config = ConfigDict(extra="forbid")
+    
+    faelle: list[Case]
+
+class Validation(BaseModel):
+    """Bewertung eines Falls durch das Validierungsmodell"""
+    model_config = ConfigDict(extra="forbid")
+    
+    valid: bool
+    score: int
+    issues: list[str]
+    suggestions: list[str]
+
+def json_schema_format(model):
+    """response_format-Parameter für Structured Outputs (z.B. für Anfragen der Batch API)"""
+    return {"type": "json_schema",
+            "json_schema": {"name": model.__name__, "schema": model.model_json_schema(), "strict": True}}
+
+# Statische Anweisungen als System-Prompt vor dem variablen Teil, damit das automatische
+# Prompt-Caching von OpenAI das gemeinsame Präfix über alle Kategorien und Fälle wiederverwenden kann
+CASE_SYSTEM_PROMPT = """Als erfahrener Notfall- und Allgemeinmediziner generierst du realistische medizinische Fälle für eine vorgegebene Kategorie.
+
+Der Fall sollte folgende Informationen im JSON-Format enthalten:
+{
+    "id": [eindeutige Fall-ID],
+    "alter": [Alter des Patienten (realistisch für die Erkrankung)],
+    "geschlecht": ["männlich" oder "weiblich"],
+    "symptome": [
+        [Liste von 3-7 Symptomen als Strings, die typisch für die Erkrankung sind]
+    ],
+    "vitalparameter": [String mit Vitalzeichen im Format "HR:80,BP:120/80,T:36.8,SpO2:98"],
+    "vorerkrankungen": [
+        [Liste relevanter Vorerkrankungen (0-3)]
+    ],
+    "vorherige_operationen": [
+        [Liste relevanter vorheriger Operationen (0-2) oder "keine"]
+    ],
+    "befunde": [Beschreibung von Untersuchungsergebnissen],
+    "enddiagnose": [Die korrekte Diagnose]
+}
+
+WICHTIGE REGELN:
+1. Stelle sicher, dass die Symptome, Vitalparameter und Befunde eine realistische Variation aufweisen und zur Enddiagnose passen.
+2. Die Vitalparameter müssen im vorgegebenen Format sein und realistische Werte enthalten.
+3. Bei pädiatrischen Fällen passe Alter und Vitalparameter entsprechend an.
+4. Berücksichtige bekannte Komorbiditäten und typische Begleiterkrankungen.
+5. Gib nur das JSON-Objekt zurück, keine Einleitung oder weiteren Text.
+6. Das JSON muss syntaktisch korrekt und gültig sein.
+7. Verwende nur übliche und DRINGLICH WICHTIG wirklich existierende, präzise medizinische Diagnosen, keine erfundenen.
+
+Liefere nur das reine JSON ohne weitere Erklärungen."""
+
+VALIDATION_SYSTEM_PROMPT = """Prüfe als erfahrener Notfall- und Allgemeinmediziner den vom Benutzer übergebenen medizinischen Fall auf klinische Plausibilität und Realismus.
+
+Bewerte folgende Aspekte:
+1. Sind die Symptome typisch und realistisch für die angegebene Diagnose?
+2. Passen die Vitalparameter zu den Symptomen und der Diagnose?
+3. Sind Alter, Geschlecht und Vorerkrankungen stimmig?
+4. Ist die Befundbeschreibung medizinisch korrekt?
+5. Gibt es Inkonsistenzen oder unplausible Angaben?
+
+Antworte im folgenden JSON-Format:
+{
+    "valid": [true/false],
+    "score": [Bewertung von 1-10, wobei 10 höchst realistisch ist],
+    "issues": [Liste von Problemen, falls vorhanden, sonst leere Liste],
+    "suggestions": [Vorschläge zur Verbesserung, falls nötig]
+}
+
+Liefere nur das reine JSON ohne weitere Erklärungen."""
+
+def _build_case_prompt(category_key, n=1):
+    """Erstellt den kategoriespezifischen Teil des Prompts für die Generierung von n medizinischen Fällen"""
     category = CASE_CATEGORIES[category_key]
     examples = ", ".join(category["examples"])
     
-    prompt = f"""Als erfahrener Notfall- und Allgemeinmediziner generiere einen realistischen medizinischen Fall für die Kategorie "{category["title"]}".
-    
-    Mögliche Diagnosen in dieser Kategorie sind: {examples}. Du darfst auch andere passende Diagnosen aus der Kategorie {category["title"]} wählen.
-    
-    Der Fall sollte folgende Informationen im JSON-Format enthalten:
-    {{
-        "id": [eindeutige Fall-ID],
-        "alter": [Alter des Patienten (realistisch für die Erkrankung)],
-        "geschlecht": ["männlich" oder "weiblich"],
-        "symptome": [
-            [Liste von 3-7 Symptomen als Strings, die typisch für die Erkrankung sind]
-        ],
-        "vitalparameter": [String mit Vitalzeichen im Format "HR:80,BP:120/80,T:36.8,SpO2:98"],
-        "vorerkrankungen": [
-            [Liste relevanter Vorerkrankungen (0-3)]
-        ],
-        "vorherige_operationen": [
-            [Liste relevanter vorheriger Operationen (0-2) oder "keine"]
-        ],
-        "befunde": [Beschreibung von Untersuchungsergebnissen],
-        "enddiagnose": [Die korrekte Diagnose]
-    }}
-    
-    WICHTIGE REGELN:
-    1. Stelle sicher, dass die Symptome, Vitalparameter und Befunde eine realistische Variation aufweisen und zur Enddiagnose passen.
-    2. Die Vitalparameter müssen im vorgegebenen Format sein und realistische Werte enthalten.
-    3. Bei pädiatrischen Fällen passe Alter und Vitalparameter entsprechend an.
-    4. Berücksichtige bekannte Komorbiditäten und typische Begleiterkrankungen.
-    5. Gib nur das JSON-Objekt zurück, keine Einleitung oder weiteren Text.
-    6. Das JSON muss syntaktisch korrekt und gültig sein.
-    7. Verwende nur übliche und DRINGLICH WICHTIG wirklich existierende, präzise medizinische Diagnosen, keine erfundenen.
-    
-    Liefere nur das reine JSON ohne weitere Erklärungen.
-    """
-    return prompt
+    prompt = (f'Kategorie: "{category["title"]}"\n'
+              f'Mögliche Diagnosen in dieser Kategorie sind: {examples}. '
+              f'Du darfst auch andere passende Diagnosen aus der Kategorie {category["title"]} wählen.\n')
+    if n == 1:
+        return prompt + 'Generiere jetzt den Fall.'
+    return (prompt + f'Generiere jetzt {n} unterschiedliche Fälle. '
+            f'Gib ein JSON-Objekt {{"faelle": [...]}} mit genau {n} unterschiedlichen Fällen zurück '
+            f'(jeder Fall ein JSON-Objekt wie beschrieben).')
+
+# Die Prompts hängen nur von Kategorie und Fallzahl ab und werden einmal beim Laden erstellt
+_CASE_PROMPTS = {(category_key, n): _build_case_prompt(category_key, n)
+                 for category_key in CASE_CATEGORIES for n in range(1, CASES_PER_REQUEST + 1)}
+
+def create_case_prompt(category_key, n=1):
+    """Liefert den vorberechneten Prompt für n Fälle einer Kategorie"""
+    prompt = _CASE_PROMPTS.get((category_key, n))
+    return prompt if prompt is not None else _build_case_prompt(category_key, n)
+
+# Für die klinische Plausibilität irrelevante Felder, die nicht an das Validierungsmodell gehen
+_VALIDATION_IGNORED_FIELDS = frozenset(("id", "kategorie", "validation_score"))
 
 def validate_case_prompt(case_json):
-    """Erstellt einen Prompt zur Validierung eines generierten Falls"""
-    prompt = f"""Prüfe als erfahrener Notfall- und Allgemeinmediziner den folgenden medizinischen Fall auf klinische Plausibilität und Realismus:
+    """
+    Erstellt den fallspezifischen Teil des Prompts zur Validierung eines generierten Falls
+    (kompaktes JSON ohne Einrückung und ohne klinisch irrelevante Felder, spart Eingabetokens).
+    """
+    return _json_dumps({key: value for key, value in case_json.items() if key not in _VALIDATION_IGNORED_FIELDS})
 
-    {json.dumps(case_json, indent=2, ensure_ascii=False)}
-    
-    Bewerte folgende Aspekte:
-    1. Sind die Symptome typisch und realistisch für die angegebene Diagnose?
-    2. Passen die Vitalparameter zu den Symptomen und der Diagnose?
-    3. Sind Alter, Geschlecht und Vorerkrankungen stimmig?
-    4. Ist die Befundbeschreibung medizinisch korrekt?
-    5. Gibt es Inkonsistenzen oder unplausible Angaben?
-    
-    Antworte im folgenden JSON-Format:
-    {{
-        "valid": [true/false],
-        "score": [Bewertung von 1-10, wobei 10 höchst realistisch ist],
-        "issues": [Liste von Problemen, falls vorhanden, sonst leere Liste],
-        "suggestions": [Vorschläge zur Verbesserung, falls nötig]
-    }}
-    
-    Liefere nur das reine JSON ohne weitere Erklärungen.
+# Statische System-Nachrichten (werden nur gelesen und daher von allen Anfragen geteilt)
+_CASE_SYSTEM_MESSAGE = {"role": "system", "content": CASE_SYSTEM_PROMPT}
+_VALIDATION_SYSTEM_MESSAGE = {"role": "system", "content": VALIDATION_SYSTEM_PROMPT}
+
+def create_case_messages(category_key, n=1):
+    """Nachrichten für die Generierung von n Fällen (statischer System-Prompt zuerst)"""
+    return [_CASE_SYSTEM_MESSAGE,
+            {"role": "user", "content": create_case_prompt(category_key, n)}]
+
+def validate_case_messages(case_json):
+    """Nachrichten für die Validierung eines Falls (statischer System-Prompt zuerst)"""
+    return [_VALIDATION_SYSTEM_MESSAGE,
+            {"role": "user", "content": validate_case_prompt(case_json)}]
+
+def _retry_api_call(func):
+    """
+    Wiederholt einen asynchronen API-Aufruf bei Rate-Limits und Verbindungsfehlern mit
+    exponentiellem Backoff und zufälliger Wartezeit; erfolgreiche Aufrufe warten nicht.
     """
-    return prompt
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        for attempt in range(1, API_MAX_ATTEMPTS + 1):
+            try:
+                return await func(*args, **kwargs)
+            except RETRYABLE_API_ERRORS as e:
+                if attempt == API_MAX_ATTEMPTS:
+                    raise
+                delay = random.uniform(API_BACKOFF_MIN, min(API_BACKOFF_MAX, API_BACKOFF_MIN * 2 ** attempt))
+                logger.warning(f"API-Fehler ({type(e).__name__}), Versuch {attempt}/{API_MAX_ATTEMPTS}, "
+                               f"nächster Versuch in {delay:.1f}s")
+                await asyncio.sleep(delay)
+    return wrapper
 
-def generate_case(category_key):
-    """Generiert einen einzelnen medizinischen Fall für die angegebene Kategorie"""
-    prompt = create_case_prompt(category_key)
+@_retry_api_call
+async def _parse_chat_completion(aclient, **kwargs):
+    """Chat-Completion-Aufruf mit Structured Outputs und Wiederholung bei vorübergehenden Fehlern"""
+    return await aclient.chat.completions.parse(**kwargs)
+
+async def generate_cases(aclient, category_key, n=1):
+    """
+    Generiert n medizinische Fälle für die angegebene Kategorie in einer Anfrage
+    (spart Anfragen pro Minute und verteilt den statischen Prompt auf mehrere Fälle).
+    
+    Returns:
+        list: Liste der generierten Fälle (leer bei Fehlern)
+    """
+    messages = create_case_messages(category_key, n)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
+        response = await _parse_chat_completion(
+            aclient,
+            model=GEN_MODEL,
+            messages=messages,
+            response_format=Case if n == 1 else CaseList,
             temperature=0.7,
-            max_tokens=1000
+            max_tokens=1000 * n
         )
         
-        case_text = response.choices[0].message.content.strip()
-        
-        # Entferne eventuelle Markdown-Formatierung
-        if case_text.startswith("```json"):
-            case_text = case_text.replace("```json", "", 1)
-        if case_text.endswith("```"):
-            case_text = case_text.rsplit("```", 1)[0]
+        message = response.choices[0].message
+        if message.parsed is None:
+            logger.error(f"Keine Fälle generiert für {category_key}: {message.refusal}")
+            return []
         
-        case_text = case_text.strip()
-        
-        try:
-            case = json.loads(case_text)
-            logger.info(f"Fall generiert: {category_key} - {case.get('enddiagnose', 'Unbekannt')}")
-            return case
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON-Parsing-Fehler: {e}")
-            logger.error(f"Problematischer Text: {case_text}")
-            return None
+        parsed = [message.parsed] if n == 1 else message.parsed.faelle[:n]
+        cases = [case.model_dump() for case in parsed]
+        for case in cases:
+            logger.info(f"Fall generiert: {category_key} - {case['enddiagnose']}")
+        return cases
         
     except Exception as e:
         logger.error(f"Fehler bei der Fallgenerierung für {category_key}: {str(e)}")
+        return []
+
+async def generate_case(aclient, category_key):
+    """Generiert einen einzelnen medizinischen Fall für die angegebene Kategorie"""
+    cases = await generate_cases(aclient, category_key, 1)
+    return cases[0] if cases else None
+
+def open_validation_cache(output_dir):
+    """Öffnet den Validierungs-Cache im Ausgabeverzeichnis (bleibt über Programmläufe erhalten)"""
+    global _validation_cache
+    os.makedirs(output_dir, exist_ok=True)
+    if _validation_cache is not None:
+        _validation_cache.close()
+    _validation_cache = sqlite3.connect(os.path.join(output_dir, VALIDATION_CACHE_FILE),
+                                        isolation_level=None, check_same_thread=False)
+    _validation_cache.execute("PRAGMA journal_mode=WAL")
+    _validation_cache.execute("CREATE TABLE IF NOT EXISTS cache (k TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+def _validation_cache_key(case):
+    """Hash des kanonischen Fall-JSON (nur die an das Validierungsmodell übergebenen Felder) als Cache-Schlüssel"""
+    canonical = _json_dumps({key: value for key, value in case.items() if key not in _VALIDATION_IGNORED_FIELDS},
+                            sort_keys=True)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+def _get_cached_validation(key):
+    """Liefert eine zwischengespeicherte Validierung oder None"""
+    if _validation_cache is None:
         return None
+    row = _validation_cache.execute("SELECT value FROM cache WHERE k = ?", (key,)).fetchone()
+    return _json_loads(row[0]) if row else None
+
+def _cache_validation(key, validation):
+    """Speichert eine erfolgreiche Validierung im Cache"""
+    if _validation_cache is not None:
+        _validation_cache.execute("INSERT OR REPLACE INTO cache (k, value) VALUES (?, ?)",
+                                  (key, _json_dumps(validation)))
+
+def _case_signature(case):
+    """Signatur eines Falls aus Enddiagnose und sortierten Symptomen (unabhängig von Groß-/Kleinschreibung)"""
+    symptoms = sorted(str(symptom).strip().lower() for symptom in case.get("symptome") or ())
+    text = str(case.get("enddiagnose", "")).strip().lower() + "|" + "|".join(symptoms)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def reset_seen_cases(cases=()):
+    """Initialisiert die Duplikaterkennung mit den bereits vorhandenen Fällen"""
+    global _seen_cases
+    _seen_cases = ScalableBloomFilter(initial_capacity=50000, error_rate=0.001) if ScalableBloomFilter else set()
+    for case in cases:
+        _seen_cases.add(_case_signature(case))
 
-def validate_case(case):
-    """Validiert einen generierten Fall auf medizinische Plausibilität"""
+def is_duplicate_case(case):
+    """
+    Prüft, ob ein Fall mit gleicher Enddiagnose und gleichen Symptomen bereits vorkam,
+    und merkt sich den Fall andernfalls (beim Bloom-Filter sind seltene Fehltreffer möglich).
+    """
+    if _seen_cases is None:
+        reset_seen_cases()
+    signature = _case_signature(case)
+    if signature in _seen_cases:
+        return True
+    _seen_cases.add(signature)
+    return False
+
+async def validate_case(aclient, case):
+    """
+    Validiert einen generierten Fall auf medizinische Plausibilität.
+    
+    Returns:
+        dict: Validierungsergebnis, oder None, wenn keine Validierung erhalten wurde (API-Fehler, Verweigerung)
+    """
     if not case:
         return {"valid": False, "score": 0, "issues": ["Kein Fall zum Validieren"], "suggestions": []}
     
-    prompt = validate_case_prompt(case)
+    # Identische Fälle nicht erneut validieren lassen
+    cache_key = _validation_cache_key(case)
+    validation = _get_cached_validation(cache_key)
+    if validation is not None:
+        logger.info(f"Fall validiert (Cache): Score {validation.get('score', 0)}")
+        return validation
+    
+    messages = validate_case_messages(case)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
+        response = await _parse_chat_completion(
+            aclient,
+            model=JUDGE_MODEL,
+            messages=messages,
+            response_format=Validation,
             temperature=0.3,
             max_tokens=500
         )
         
-        validation_text = response.choices[0].message.content.strip()
-        
-        # Entferne eventuelle Markdown-Formatierung
-        if validation_text.startswith("```json"):
-            validation_text = validation_text.replace("```json", "", 1)
-        if validation_text.endswith("```"):
-            validation_text = validation_text.rsplit("```", 1)[0]
-            
-        validation_text = validation_text.strip()
+        message = response.choices[0].message
+        if message.parsed is None:
+            logger.error(f"Keine Validierung erhalten: {message.refusal}")
+            return None
         
-        try:
-            validation = json.loads(validation_text)
-            logger.info(f"Fall validiert: Score {validation.get('score', 0)}")
-            return validation
-        except json.JSONDecodeError as e:
-            logger.error(f"Validierungs-JSON-Parsing-Fehler: {e}")
-            logger.error(f"Problematischer Validierungstext: {validation_text}")
-            return {"valid": False, "score": 0, "issues": [f"JSON-Parsing-Fehler: {str(e)}"], "suggestions": []}
+        validation = message.parsed.model_dump()
+        logger.info(f"Fall validiert: Score {validation['score']}")
+        _cache_validation(cache_key, validation)
+        return validation
         
     except Exception as e:
         logger.error(f"Fehler bei der Fallvalidierung: {str(e)}")
-        return {"valid": False, "score": 0, "issues": [f"Fehler bei API-Aufruf: {str(e)}"], "suggestions": []}
+        return None
 
-def generate_batch(count=100, min_score=7):
-    """Generiert einen Batch von medizinischen Fällen mit der angegebenen Verteilung"""
-    cases = []
-    validations = []
-    stats = {cat: 0 for cat in CASE_CATEGORIES}
-    
+def calculate_category_counts(count):
+    """Verteilt die gewünschte Anzahl an Fällen gemäß den Prozentsätzen auf die Kategorien"""
     # Stelle sicher, dass jede Kategorie mindestens einen Fall bekommt
     min_cases_per_category = 1
     
@@ -266,158 +539,459 @@ def generate_batch(count=100, min_score=7):
         for cat in CASE_CATEGORIES:
             category_counts[cat] = 1 if cat in selected_cats else 0
     else:
-        # Erst mindestens einen Fall pro Kategorie zuweisen
-        for cat in CASE_CATEGORIES:
-            category_counts[cat] = min_cases_per_category
-        
-        # Verbleibende Fälle nach Prozentsatz verteilen
+        # Erst mindestens einen Fall pro Kategorie zuweisen, die übrigen Fälle proportional
+        # zu den (normierten) Prozentsätzen nach dem Hare-Niemeyer-Verfahren verteilen:
+        # abgerundete Quoten, Rest an die Kategorien mit den größten Nachkommaanteilen
         remaining = count - (min_cases_per_category * len(CASE_CATEGORIES))
+        total_percentage = sum(info["percentage"] for info in CASE_CATEGORIES.values())
+        quotas = {cat: remaining * info["percentage"] / total_percentage for cat, info in CASE_CATEGORIES.items()}
         
-        if remaining > 0:
-            for cat, info in CASE_CATEGORIES.items():
-                # Zusätzliche Fälle basierend auf Prozentsatz zuweisen
-                additional_count = int(remaining * (info["percentage"] / 100))
-                category_counts[cat] += additional_count
-                remaining -= additional_count
-            
-            # Verteile verbleibende Fälle auf Kategorien mit dem höchsten Prozentsatz
-            if remaining > 0:
-                sorted_cats = sorted(CASE_CATEGORIES.items(), key=lambda x: x[1]["percentage"], reverse=True)
-                for i in range(remaining):
-                    category_counts[sorted_cats[i % len(sorted_cats)][0]] += 1
+        for cat, quota in quotas.items():
+            category_counts[cat] = min_cases_per_category + int(quota)
+        
+        leftover = remaining - sum(int(quota) for quota in quotas.values())
+        by_remainder = sorted(quotas, key=lambda cat: quotas[cat] - int(quotas[cat]), reverse=True)
+        for cat in by_remainder[:leftover]:
+            category_counts[cat] += 1
     
+    return category_counts
+
+def generate_batch(count=100, min_score=7):
+    """Generiert einen Batch von medizinischen Fällen mit der angegebenen Verteilung"""
+    cases = []
+    validations = []
+    stats = {cat: 0 for cat in CASE_CATEGORIES}
+    
+    category_counts = calculate_category_counts(count)
     logger.info(f"Zielverteilung der Fälle: {category_counts}")
     
-    # Generiere Fälle für jede Kategorie
-    for category, target_count in category_counts.items():
-        cat_cases = 0
-        attempts = 0
-        max_attempts = target_count * 2  # Maximal doppelt so viele Versuche wie Zielfälle
-        
-        logger.info(f"Generiere {target_count} Fälle für Kategorie '{CASE_CATEGORIES[category]['title']}'")
-        
-        while cat_cases < target_count and attempts < max_attempts:
-            attempts += 1
-            
-            # Generiere und validiere einen Fall
-            case = generate_case(category)
-            if case:
-                validation = validate_case(case)
-                
-                # Prüfe, ob der Fall den Qualitätsanforderungen entspricht
-                if validation.get("valid", False) and validation.get("score", 0) >= min_score:
-                    # Füge den Fall zur Liste hinzu
-                    case["kategorie"] = category
-                    case["validation_score"] = validation.get("score", 0)
-                    cases.append(case)
-                    validations.append(validation)
-                    cat_cases += 1
-                    stats[category] += 1
-                    
-                    logger.info(f"Fall {cat_cases}/{target_count} für '{category}' akzeptiert (Score: {validation.get('score', 0)})")
-                else:
-                    issues = ", ".join(validation.get("issues", ["Unbekannter Fehler"]))
-                    logger.warning(f"Fall für '{category}' abgelehnt (Score: {validation.get('score', 0)}): {issues}")
-            
-            # Pause zwischen API-Aufrufen
-            time.sleep(1)
-        
-        logger.info(f"Abgeschlossen: {cat_cases}/{target_count} Fälle für '{category}' generiert")
+    # Generiere Fälle für alle Kategorien nebenläufig
+    category_results = asyncio.run(_generate_categories(category_counts, min_score))
+    
+    for category, (cat_cases, cat_validations) in zip(category_counts, category_results):
+        cases.extend(cat_cases)
+        validations.extend(cat_validations)
+        stats[category] = len(cat_cases)
     
     logger.info(f"Generierung abgeschlossen: {len(cases)}/{count} Fälle insgesamt")
     logger.info(f"Tatsächliche Verteilung: {stats}")
     
     return cases, validations
 
-def save_to_csv(cases, output_dir):
-    """Speichert die generierten Fälle in CSV-Dateien im MIMIC-Format"""
-    os.makedirs(output_dir, exist_ok=True)
+async def _generate_categories(category_counts, min_score):
+    """
+    Generiert die Fälle aller Kategorien nebenläufig; die Anzahl gleichzeitiger Anfragen wird
+    getrennt für Generierung und Validierung (MAX_GENERATION_CONCURRENCY, MAX_VALIDATION_CONCURRENCY)
+    und die API-Aufrufe pro Minute durch REQUESTS_PER_MINUTE begrenzt.
     
-    # patients.csv
-    patients = []
-    for case in cases:
-        patient = {
-            'patient_id': case.get('id', ''),
-            'age': case.get('alter', 0),
-            'gender': 'M' if case.get('geschlecht', '').lower() == 'männlich' else 'F',
-            'category': case.get('kategorie', ''),
-            'validation_score': case.get('validation_score', 0)
-        }
-        patients.append(patient)
+    Returns:
+        list: (Fälle, Validierungen) pro Kategorie in der Reihenfolge von category_counts
+    """
+    generation_slots = asyncio.Semaphore(MAX_GENERATION_CONCURRENCY)
+    validation_slots = asyncio.Semaphore(MAX_VALIDATION_CONCURRENCY)
+    limiter = AsyncLimiter(REQUESTS_PER_MINUTE, 60) if AsyncLimiter is not None else contextlib.nullcontext()
     
-    patients_df = pd.DataFrame(patients)
-    patients_df.to_csv(os.path.join(output_dir, 'patients.csv'), index=False)
+    async with create_async_client() as aclient:
+        return await asyncio.gather(*(
+            _generate_category(aclient, category, target_count, min_score, generation_slots, validation_slots, limiter)
+            for category, target_count in category_counts.items()
+        ))
+
+async def _validate_generated_case(aclient, case, category, min_score, validation_slots, limiter):
+    """
+    Validiert einen generierten Fall (erst lokal, dann durch das Validierungsmodell).
     
-    # diagnoses.csv
-    diagnoses = []
-    for case in cases:
-        diagnose = {
-            'patient_id': case.get('id', ''),
-            'diagnosis': case.get('enddiagnose', ''),
-            'icd_code': ''  # ICD-Codes könnten separat generiert werden
-        }
-        diagnoses.append(diagnose)
+    Returns:
+        tuple: (Ergebnis, Fall, Validierung) mit Ergebnis CASE_ACCEPTED, CASE_REJECTED
+            (lokal oder vom Validierungsmodell abgelehnt) oder CASE_FAILED (Duplikat, keine Validierung)
+    """
+    issues = cheap_validate(case)
+    if issues:
+        logger.warning(f"Fall für '{category}' lokal abgelehnt: {', '.join(issues)}")
+        return CASE_REJECTED, case, None
     
-    diagnoses_df = pd.DataFrame(diagnoses)
-    diagnoses_df.to_csv(os.path.join(output_dir, 'diagnoses.csv'), index=False)
+    if is_duplicate_case(case):
+        logger.warning(f"Fall für '{category}' verworfen: Duplikat ({case.get('enddiagnose')})")
+        return CASE_FAILED, case, None
     
-    # vitals.csv
-    vitals = []
-    for case in cases:
-        vitals_str = case.get('vitalparameter', '')
-        vitals_dict = {'patient_id': case.get('id', '')}
+    async with validation_slots:
+        async with limiter:
+            validation = await validate_case(aclient, case)
+    
+    if validation is None:
+        return CASE_FAILED, case, None
+    
+    # Prüfe, ob der Fall den Qualitätsanforderungen entspricht
+    if validation.get("valid", False) and validation.get("score", 0) >= min_score:
+        case["kategorie"] = category
+        case["validation_score"] = validation.get("score", 0)
+        return CASE_ACCEPTED, case, validation
+    
+    issues = ", ".join(validation.get("issues", ["Unbekannter Fehler"]))
+    logger.warning(f"Fall für '{category}' abgelehnt (Score: {validation.get('score', 0)}): {issues}")
+    return CASE_REJECTED, case, validation
+
+async def _process_cases(aclient, category, n, min_score, generation_slots, validation_slots, limiter):
+    """
+    Generiert n Fälle in einer Anfrage und validiert sie einzeln.
+    
+    Returns:
+        list: n (Ergebnis, Fall, Validierung)-Tupel in Reihenfolge der Antwort; nicht
+            gelieferte Fälle (API-Fehler, unvollständige Antwort) als CASE_FAILED ohne Fall
+    """
+    async with generation_slots:
+        async with limiter:
+            cases = await generate_cases(aclient, category, n)
+    
+    results = await asyncio.gather(*(
+        _validate_generated_case(aclient, case, category, min_score, validation_slots, limiter) for case in cases
+    ))
+    return results + [(CASE_FAILED, None, None)] * (n - len(cases))
+
+async def _generate_category(aclient, category, target_count, min_score, generation_slots, validation_slots, limiter):
+    """
+    Generiert die Fälle einer Kategorie in Runden, bis das Ziel erreicht ist oder zu viele Fälle
+    in Folge abgelehnt werden (MAX_REJECTION_STREAK) bzw. unbrauchbar sind (MAX_GENERATION_FAILURES).
+    """
+    cat_cases = []
+    validations = []
+    accepted = 0
+    rejected = 0
+    consecutive_rejects = 0
+    consecutive_failures = 0
+    
+    logger.info(f"Generiere {target_count} Fälle für Kategorie '{CASE_CATEGORIES[category]['title']}'")
+    
+    while len(cat_cases) < target_count:
+        # So viele Fälle gleichzeitig anstoßen, wie noch fehlen (bis zu CASES_PER_REQUEST pro Anfrage)
+        round_size = target_count - len(cat_cases)
+        request_sizes = [min(CASES_PER_REQUEST, round_size - start)
+                         for start in range(0, round_size, CASES_PER_REQUEST)]
         
-        if vitals_str:
-            for pair in vitals_str.split(','):
-                if ':' in pair:
-                    key, value = pair.split(':', 1)
-                    if key.strip() == 'HR':
-                        vitals_dict['heart_rate'] = value.strip()
-                    elif key.strip() == 'BP' and '/' in value:
-                        sys, dia = value.strip().split('/')
-                        vitals_dict['blood_pressure_systolic'] = sys
-                        vitals_dict['blood_pressure_diastolic'] = dia
-                    elif key.strip() == 'T':
-                        vitals_dict['temperature'] = value.strip()
-                    elif key.strip() == 'SpO2':
-                        vitals_dict['oxygen_saturation'] = value.strip()
-                    elif key.strip() == 'RR':
-                        vitals_dict['respiratory_rate'] = value.strip()
+        results = await asyncio.gather(*(
+            _process_cases(aclient, category, n, min_score, generation_slots, validation_slots, limiter)
+            for n in request_sizes
+        ))
         
-        vitals.append(vitals_dict)
+        # Ergebnisse in Reihenfolge der Anfragen auswerten: Die Ablehnungsserie zählt nur
+        # Ablehnungen seit dem letzten akzeptierten Fall, Fehler werden getrennt gezählt
+        for outcome, case, validation in (result for request_results in results for result in request_results):
+            if outcome == CASE_FAILED:
+                consecutive_failures += 1
+                continue
+            consecutive_failures = 0
+            if outcome == CASE_REJECTED:
+                rejected += 1
+                consecutive_rejects += 1
+                continue
+            accepted += 1
+            consecutive_rejects = 0
+            if len(cat_cases) < target_count:
+                cat_cases.append(case)
+                validations.append(validation)
+                logger.info(f"Fall {len(cat_cases)}/{target_count} für '{category}' akzeptiert (Score: {validation.get('score', 0)})")
+        
+        if len(cat_cases) >= target_count:
+            break
+        if consecutive_rejects >= MAX_REJECTION_STREAK:
+            logger.error(f"Abbruch für '{category}': {consecutive_rejects} Fälle in Folge abgelehnt")
+            break
+        if consecutive_failures >= MAX_GENERATION_FAILURES:
+            logger.error(f"Abbruch für '{category}': {consecutive_failures} Fälle in Folge nicht generiert "
+                         f"oder nicht validiert (API-Fehler oder Duplikate)")
+            break
+    
+    judged = accepted + rejected
+    acceptance_rate = accepted / judged if judged else 1.0
+    if acceptance_rate < MIN_ACCEPTANCE_RATE:
+        logger.warning(f"Niedrige Akzeptanzrate für '{category}': {acceptance_rate:.0%} "
+                       f"({accepted}/{judged}) - Prompt oder Modell prüfen")
     
-    vitals_df = pd.DataFrame(vitals)
-    vitals_df.to_csv(os.path.join(output_dir, 'vitals.csv'), index=False)
+    logger.info(f"Abgeschlossen: {len(cat_cases)}/{target_count} Fälle für '{category}' generiert")
+    return cat_cases, validations
+
+# Dateien im Ausgabeverzeichnis: Rohdaten (ein Fall pro Zeile, nur angehängt), Gesamtsnapshot
+# und CSV-Tabellen im MIMIC-Format mit ihren Spalten
+CASES_NDJSON_FILE = 'cases.ndjson'
+CASES_JSON_FILE = 'cases.json'
+PATIENT_FIELDS = ['patient_id', 'age', 'gender', 'category', 'validation_score']
+DIAGNOSIS_FIELDS = ['patient_id', 'diagnosis', 'icd_code']
+VITALS_FIELDS = ['patient_id', 'heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+                 'temperature', 'oxygen_saturation', 'respiratory_rate']
+
+# Vitalparameter-String "HR:80,BP:120/80,T:36.8,SpO2:98", Blutdruckwert "120/80"
+# und Zuordnung der Kürzel zu den CSV-Spalten
+_VITAL_RE = re.compile(r'\b(?P<k>HR|RR|T|SpO2|BP)\s*:\s*(?P<v>[^,]+)')
+_BP_RE = re.compile(r'(\d+)\s*/\s*(\d+)')
+_VITAL_COLUMNS = {'HR': 'heart_rate', 'T': 'temperature', 'SpO2': 'oxygen_saturation', 'RR': 'respiratory_rate'}
+
+def parse_vitals(vitals_str):
+    """
+    Zerlegt einen Vitalparameter-String in einem Regex-Durchlauf.
+    
+    Returns:
+        dict: CSV-Spalte -> Wert (nur vorhandene Vitalparameter)
+    """
+    vitals = {}
+    if not vitals_str:
+        return vitals
+    for match in _VITAL_RE.finditer(vitals_str):
+        key = match['k']
+        column = _VITAL_COLUMNS.get(key)
+        if column is not None:
+            vitals[column] = match['v'].strip()
+        else:
+            bp = _BP_RE.search(match['v'])
+            if bp:
+                vitals['blood_pressure_systolic'], vitals['blood_pressure_diastolic'] = bp.groups()
+    return vitals
+
+# Lokale Plausibilitätsprüfung vor dem Aufruf des Validierungsmodells: Pflichtfelder
+# und realistische Wertebereiche (Alter in Jahren, Vitalparameter)
+REQUIRED_CASE_FIELDS = ('alter', 'geschlecht', 'symptome', 'vitalparameter', 'befunde', 'enddiagnose')
+VALID_GENDERS = frozenset(('männlich', 'weiblich'))
+VITAL_RANGES = {
+    'heart_rate': ('Herzfrequenz', 30, 220),
+    'blood_pressure_systolic': ('Systolischer Blutdruck', 60, 260),
+    'temperature': ('Temperatur', 32, 42),
+    'oxygen_saturation': ('Sauerstoffsättigung', 50, 100),
+}
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?')
+
+def cheap_validate(case):
+    """
+    Prüft einen Fall lokal auf offensichtliche Fehler, die keinen Aufruf des Validierungsmodells brauchen.
+    
+    Returns:
+        list: Liste gefundener Probleme (leer, wenn der Fall plausibel ist)
+    """
+    issues = [f"Feld '{field}' fehlt" for field in REQUIRED_CASE_FIELDS if case.get(field) in (None, '', [])]
+    
+    alter = case.get('alter')
+    if not isinstance(alter, (int, float)) or isinstance(alter, bool) or not 0 <= alter <= 110:
+        issues.append(f"Unplausibles Alter: {alter}")
+    
+    if case.get('geschlecht') not in VALID_GENDERS:
+        issues.append(f"Unbekanntes Geschlecht: {case.get('geschlecht')}")
+    
+    vitals = parse_vitals(case.get('vitalparameter', ''))
+    if 'heart_rate' not in vitals or 'blood_pressure_systolic' not in vitals:
+        issues.append("Vitalparameter ohne HR oder BP")
+    for column, (name, low, high) in VITAL_RANGES.items():
+        if column not in vitals:
+            continue
+        number = _NUMBER_RE.search(vitals[column])
+        if not number or not low <= float(number.group().replace(',', '.')) <= high:
+            issues.append(f"{name} außerhalb von {low}-{high}: {vitals[column]}")
+    
+    return issues
+
+def case_to_rows(case):
+    """
+    Wandelt einen Fall in die Zeilen der MIMIC-Tabellen um.
+    
+    Returns:
+        tuple: (Zeile für patients.csv, Zeile für diagnoses.csv, Zeile für vitals.csv)
+    """
+    patient = {
+        'patient_id': case.get('id', ''),
+        'age': case.get('alter', 0),
+        'gender': 'M' if case.get('geschlecht', '').lower() == 'männlich' else 'F',
+        'category': case.get('kategorie', ''),
+        'validation_score': case.get('validation_score', 0)
+    }
+    
+    diagnose = {
+        'patient_id': case.get('id', ''),
+        'diagnosis': case.get('enddiagnose', ''),
+        'icd_code': ''  # ICD-Codes könnten separat generiert werden
+    }
+    
+    vitals_dict = {'patient_id': case.get('id', '')}
+    vitals_dict.update(parse_vitals(case.get('vitalparameter', '')))
+    
+    return patient, diagnose, vitals_dict
+
+def save_to_csv(cases, output_dir):
+    """Speichert die generierten Fälle in CSV-Dateien im MIMIC-Format"""
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Ein Durchlauf über alle Fälle, der alle drei Tabellen zugleich schreibt
+    with open(os.path.join(output_dir, 'patients.csv'), 'w', newline='', encoding='utf-8') as patients_file, \
+         open(os.path.join(output_dir, 'diagnoses.csv'), 'w', newline='', encoding='utf-8') as diagnoses_file, \
+         open(os.path.join(output_dir, 'vitals.csv'), 'w', newline='', encoding='utf-8') as vitals_file:
+        writers = [csv.DictWriter(patients_file, fieldnames=PATIENT_FIELDS, lineterminator='\n'),
+                   csv.DictWriter(diagnoses_file, fieldnames=DIAGNOSIS_FIELDS, lineterminator='\n'),
+                   csv.DictWriter(vitals_file, fieldnames=VITALS_FIELDS, lineterminator='\n')]
+        for writer in writers:
+            writer.writeheader()
+        for case in cases:
+            for writer, row in zip(writers, case_to_rows(case)):
+                writer.writerow(row)
+    
+    if pq is not None:
+        # Der Parquet-Export ist optional und darf die CSV- und JSON-Ausgabe nicht verhindern
+        try:
+            save_to_parquet(cases, output_dir)
+        except (pa.ArrowException, OSError) as e:
+            logger.error(f"Parquet-Export fehlgeschlagen: {str(e)}")
     
     # Originaldaten speichern
-    with open(os.path.join(output_dir, 'cases.json'), 'w', encoding='utf-8') as f:
-        json.dump(cases, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(output_dir, CASES_JSON_FILE), 'w', encoding='utf-8') as f:
+        f.write(_json_dumps_pretty(cases))
     
     logger.info(f"Daten gespeichert in {output_dir}")
     return {
-        'patients_count': len(patients),
-        'diagnoses_count': len(diagnoses),
-        'vitals_count': len(vitals)
+        'patients_count': len(cases),
+        'diagnoses_count': len(cases),
+        'vitals_count': len(cases)
     }
 
+def _to_number(value):
+    """Zahl aus einem Tabellenwert (Zahl oder Zahl mit Einheit wie "38,5 °C") oder None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    number = _NUMBER_RE.search(str(value)) if value is not None else None
+    return float(number.group().replace(',', '.')) if number else None
+
+def _to_string(value):
+    """Zeichenkette aus einem Tabellenwert oder None"""
+    return None if value is None else str(value)
+
+def _parquet_schema(fields, numeric_fields):
+    """Explizites Schema: Zahlenspalten als float64 (fehlende Werte als null), übrige als string"""
+    return pa.schema([(field, pa.float64() if field in numeric_fields else pa.string()) for field in fields])
+
+def save_to_parquet(cases, output_dir):
+    """
+    Speichert die MIMIC-Tabellen zusätzlich als zstd-komprimierte Parquet-Dateien
+    (deutlich kleiner und schneller zu lesen; die CSV-Dateien bleiben das Format für MIMICIntegration).
+    
+    Ältere Fälle enthalten teils Freitext statt Zahlen (z. B. Alter "2 Jahre"); Zahlenspalten werden
+    daher einheitlich umgewandelt. Beim Alter zählen nur echte Zahlen, sonst bleibt der Wert leer.
+    """
+    tables = ([], [], [])
+    for case in cases:
+        for rows, row in zip(tables, case_to_rows(case)):
+            rows.append(row)
+    
+    for file_name, fields, numeric_fields, rows in (
+            ('patients.parquet', PATIENT_FIELDS, ('age', 'validation_score'), tables[0]),
+            ('diagnoses.parquet', DIAGNOSIS_FIELDS, (), tables[1]),
+            ('vitals.parquet', VITALS_FIELDS, VITALS_FIELDS[1:], tables[2])):
+        columns = {}
+        for field in fields:
+            values = [row.get(field) for row in rows]
+            if field == 'age':
+                columns[field] = [float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+                                  for v in values]
+            elif field in numeric_fields:
+                columns[field] = [_to_number(v) for v in values]
+            else:
+                columns[field] = [_to_string(v) for v in values]
+        table = pa.table(columns, schema=_parquet_schema(fields, numeric_fields))
+        pq.write_table(table, os.path.join(output_dir, file_name), compression='zstd')
+
+def load_cases(output_dir):
+    """
+    Lädt bereits generierte Fälle (cases.ndjson, sonst den Snapshot cases.json).
+    
+    Returns:
+        list: Liste der vorhandenen Fälle (leer, wenn keine vorhanden oder lesbar sind)
+    """
+    ndjson_file = os.path.join(output_dir, CASES_NDJSON_FILE)
+    cases_file = os.path.join(output_dir, CASES_JSON_FILE)
+    
+    try:
+        if os.path.exists(ndjson_file):
+            with open(ndjson_file, 'r', encoding='utf-8') as f:
+                return [_json_loads(line) for line in f if line.strip()]
+        if os.path.exists(cases_file):
+            with open(cases_file, 'r', encoding='utf-8') as f:
+                return _json_loads(f.read())
+    except Exception as e:
+        logger.error(f"Fehler beim Laden bestehender Daten: {str(e)}")
+    return []
+
+class CaseWriter:
+    """
+    Hängt neue Fälle an cases.ndjson und die CSV-Tabellen an, statt nach jedem Batch
+    alle Dateien neu zu schreiben. Die Dateien bleiben während des gesamten Laufs geöffnet.
+    """
+    
+    def __init__(self, output_dir, existing_cases=()):
+        """
+        Args:
+            output_dir (str): Ausgabeverzeichnis
+            existing_cases (list): Bereits vorhandene Fälle; fehlende Dateien werden damit angelegt
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        self._files = []
+        
+        ndjson_file = os.path.join(output_dir, CASES_NDJSON_FILE)
+        migrate = not os.path.exists(ndjson_file)
+        self._ndjson = self._open(ndjson_file)
+        if migrate:
+            self._write_json_lines(existing_cases)
+        
+        self._writers = []
+        for file_name, fields in (('patients.csv', PATIENT_FIELDS),
+                                  ('diagnoses.csv', DIAGNOSIS_FIELDS),
+                                  ('vitals.csv', VITALS_FIELDS)):
+            path = os.path.join(output_dir, file_name)
+            header = None
+            if os.path.exists(path):
+                with open(path, 'r', newline='', encoding='utf-8') as f:
+                    header = next(csv.reader(f), None)
+            
+            # Spaltenreihenfolge einer bestehenden Datei übernehmen
+            writer = csv.DictWriter(self._open(path, newline=''), fieldnames=header or fields,
+                                    extrasaction='ignore', lineterminator='\n')
+            if header is None:
+                writer.writeheader()
+                for case in existing_cases:
+                    writer.writerow(case_to_rows(case)[len(self._writers)])
+            self._writers.append(writer)
+    
+    def _open(self, path, newline=None):
+        f = open(path, 'a', buffering=1 << 20, encoding='utf-8', newline=newline)
+        self._files.append(f)
+        return f
+    
+    def _write_json_lines(self, cases):
+        for case in cases:
+            self._ndjson.write(_json_dumps(case) + "\n")
+    
+    def append(self, cases):
+        """Hängt neue Fälle an alle Dateien an und schreibt die Puffer auf die Festplatte"""
+        self._write_json_lines(cases)
+        for case in cases:
+            for writer, row in zip(self._writers, case_to_rows(case)):
+                writer.writerow(row)
+        for f in self._files:
+            f.flush()
+    
+    def close(self):
+        for f in self._files:
+            f.close()
+
 def generate_patient_cases(total_count=100, batch_size=10, min_score=7, output_dir='mimic_data'):
     """Hauptfunktion zur Generierung der synthetischen Patientenfälle"""
     start_time = datetime.now()
+    open_validation_cache(output_dir)
     
     # Prüfen, ob bereits Fälle vorhanden sind und diese laden
-    cases_file = os.path.join(output_dir, 'cases.json')
-    all_cases = []
+    all_cases = load_cases(output_dir)
     all_validations = []
     
-    if os.path.exists(cases_file):
-        try:
-            with open(cases_file, 'r', encoding='utf-8') as f:
-                all_cases = json.load(f)
-            logger.info(f"Bestehende Daten geladen: {len(all_cases)} Fälle gefunden")
-            print(f"Bestehende Daten geladen: {len(all_cases)} Fälle gefunden")
-        except Exception as e:
-            logger.error(f"Fehler beim Laden bestehender Daten: {str(e)}")
-            all_cases = []
+    if all_cases:
+        logger.info(f"Bestehende Daten geladen: {len(all_cases)} Fälle gefunden")
+        print(f"Bestehende Daten geladen: {len(all_cases)} Fälle gefunden")
+    
+    writer = CaseWriter(output_dir, all_cases)
+    reset_seen_cases(all_cases)
     
     existing_count = len(all_cases)
     target_count = existing_count + total_count
@@ -441,8 +1015,8 @@ def generate_patient_cases(total_count=100, batch_size=10, min_score=7, output_d
         
         logger.info(f"Batch abgeschlossen: {len(batch_cases)} Fälle generiert")
         
-        # Zwischenspeichern nach jedem Batch
-        save_to_csv(all_cases, output_dir)
+        # Zwischenspeichern nach jedem Batch (nur die neuen Fälle anhängen)
+        writer.append(batch_cases)
         logger.info(f"Zwischenspeicherung: {len(all_cases)} Fälle gespeichert")
         print(f"Zwischenspeicherung: {len(all_cases)}/{target_count} Fälle gespeichert ({(len(all_cases)/target_count)*100:.1f}%)")
     
@@ -451,7 +1025,8 @@ def generate_patient_cases(total_count=100, batch_size=10, min_score=7, output_d
     
     logger.info(f"Generierung abgeschlossen: {len(all_cases)} Fälle in {duration:.1f} Minuten")
     
-    # Finale Speicherung
+    # Finale Speicherung (Gesamtsnapshot cases.json und CSV-Dateien einmalig neu schreiben)
+    writer.close()
     stats = save_to_csv(all_cases, output_dir)
     
     # Generiere Zusammenfassung
@@ -474,6 +1049,179 @@ def generate_patient_cases(total_count=100, batch_size=10, min_score=7, output_d
         "stats": stats
     }
 
+def _run_openai_batch(requests, description):
+    """
+    Führt Chat-Completion-Anfragen über die OpenAI Batch API aus (halbe Kosten, eigenes
+    Rate-Limit, Bearbeitung innerhalb von 24 Stunden) und wartet auf das Ergebnis.
+    
+    Args:
+        requests (dict): custom_id -> Request-Body für /v1/chat/completions
+        description (str): Beschreibung des Auftrags für Logging und Metadaten
+        
+    Returns:
+        dict: custom_id -> Antworttext (nur erfolgreich bearbeitete Anfragen)
+    """
+    if not requests:
+        return {}
+    
+    # Anfragen als JSONL-Datei hochladen
+    with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as f:
+        for custom_id, body in requests.items():
+            f.write(_json_dumps({"custom_id": custom_id, "method": "POST",
+                                 "url": "/v1/chat/completions", "body": body}) + "\n")
+        input_path = f.name
+    
+    try:
+        with open(input_path, 'rb') as f:
+            input_file = client.files.create(file=f, purpose="batch")
+    finally:
+        os.remove(input_path)
+    
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+        metadata={"description": description}
+    )
+    logger.info(f"Batch-Auftrag '{description}' gestartet: {batch.id} ({len(requests)} Anfragen)")
+    
+    # Auf den Abschluss des Auftrags warten
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(BATCH_POLL_INTERVAL)
+        batch = client.batches.retrieve(batch.id)
+        logger.info(f"Batch-Auftrag {batch.id}: {batch.status} ({batch.request_counts.completed}/{batch.request_counts.total})")
+    
+    if batch.status != "completed" or not batch.output_file_id:
+        logger.error(f"Batch-Auftrag {batch.id} nicht abgeschlossen: {batch.status}")
+        return {}
+    
+    # Ergebnisse auslesen
+    results = {}
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        item = _json_loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            logger.error(f"Batch-Anfrage {item.get('custom_id')} fehlgeschlagen: {item.get('error')}")
+            continue
+        message = response["body"]["choices"][0]["message"]
+        if message.get("content") is None:
+            logger.error(f"Keine Antwort für Batch-Anfrage {item.get('custom_id')}: {message.get('refusal')}")
+            continue
+        results[item["custom_id"]] = message["content"]
+    
+    return results
+
+def generate_patient_cases_batch(total_count=100, min_score=7, output_dir='mimic_data'):
+    """
+    Generiert synthetische Patientenfälle über die OpenAI Batch API. Alle Fälle werden in einem
+    Auftrag generiert und anschließend in einem zweiten Auftrag validiert; abgelehnte Fälle
+    werden nicht nachgeneriert.
+    
+    Returns:
+        dict: Zusammenfassung wie bei generate_patient_cases
+    """
+    start_time = datetime.now()
+    open_validation_cache(output_dir)
+    
+    all_cases = load_cases(output_dir)
+    if all_cases:
+        logger.info(f"Bestehende Daten geladen: {len(all_cases)} Fälle gefunden")
+    reset_seen_cases(all_cases)
+    
+    category_counts = calculate_category_counts(total_count)
+    logger.info(f"Zielverteilung der Fälle: {category_counts}")
+    
+    # Generierung aller Fälle in einem Auftrag
+    categories = {}
+    generation_requests = {}
+    for category, target_count in category_counts.items():
+        for _ in range(target_count):
+            custom_id = f"gen-{len(generation_requests)}"
+            categories[custom_id] = category
+            generation_requests[custom_id] = {
+                "model": GEN_MODEL,
+                "messages": create_case_messages(category),
+                "response_format": json_schema_format(Case),
+                "temperature": 0.7,
+                "max_tokens": 1000
+            }
+    
+    generated = {}
+    for custom_id, case_text in _run_openai_batch(generation_requests, "Fallgenerierung").items():
+        try:
+            generated[custom_id] = _json_loads(case_text)
+        except (TypeError, ValueError) as e:
+            logger.error(f"JSON-Parsing-Fehler für {custom_id}: {e}")
+    
+    # Offensichtlich unplausible Fälle und Duplikate lokal aussortieren
+    for custom_id, case in list(generated.items()):
+        issues = cheap_validate(case)
+        if issues:
+            logger.warning(f"Fall für '{categories[custom_id]}' lokal abgelehnt: {', '.join(issues)}")
+            del generated[custom_id]
+        elif is_duplicate_case(case):
+            logger.warning(f"Fall für '{categories[custom_id]}' abgelehnt: Duplikat ({case.get('enddiagnose')})")
+            del generated[custom_id]
+    
+    # Validierung aller noch nicht validierten Fälle in einem zweiten Auftrag (gleiche custom_id)
+    cache_keys = {custom_id: _validation_cache_key(case) for custom_id, case in generated.items()}
+    cached = {custom_id: _get_cached_validation(key) for custom_id, key in cache_keys.items()}
+    validation_requests = {
+        custom_id: {
+            "model": JUDGE_MODEL,
+            "messages": validate_case_messages(case),
+            "response_format": json_schema_format(Validation),
+            "temperature": 0.3,
+            "max_tokens": 500
+        }
+        for custom_id, case in generated.items() if cached[custom_id] is None
+    }
+    validation_texts = _run_openai_batch(validation_requests, "Fallvalidierung")
+    
+    new_cases = []
+    validations = []
+    for custom_id, case in generated.items():
+        validation = cached[custom_id]
+        if validation is None:
+            try:
+                validation = _json_loads(validation_texts.get(custom_id, ""))
+            except (TypeError, ValueError):
+                logger.error(f"Keine gültige Validierung für {custom_id}")
+                continue
+            _cache_validation(cache_keys[custom_id], validation)
+        
+        if validation.get("valid", False) and validation.get("score", 0) >= min_score:
+            case["kategorie"] = categories[custom_id]
+            case["validation_score"] = validation.get("score", 0)
+            new_cases.append(case)
+            validations.append(validation)
+        else:
+            issues = ", ".join(validation.get("issues", ["Unbekannter Fehler"]))
+            logger.warning(f"Fall für '{categories[custom_id]}' abgelehnt (Score: {validation.get('score', 0)}): {issues}")
+    
+    writer = CaseWriter(output_dir, all_cases)
+    writer.append(new_cases)
+    writer.close()
+    
+    all_cases.extend(new_cases)
+    stats = save_to_csv(all_cases, output_dir)
+    
+    duration = (datetime.now() - start_time).total_seconds() / 60
+    logger.info(f"Batch-Generierung abgeschlossen: {len(new_cases)}/{total_count} Fälle in {duration:.1f} Minuten")
+    
+    category_stats = {}
+    for case in new_cases:
+        category_stats[case["kategorie"]] = category_stats.get(case["kategorie"], 0) + 1
+    
+    return {
+        "cases_count": len(new_cases),
+        "duration_minutes": duration,
+        "categories": category_stats,
+        "stats": stats
+    }
+
 if __name__ == "__main__":
     # Standardparameter
     total_cases = 1000  # Anzahl der neu zu generierenden Fälle
@@ -481,18 +1229,10 @@ if __name__ == "__main__":
     max_total = 5000    # Maximale Gesamtzahl der Fälle
     min_quality_score = 7  # Mindestqualität (1-10)
     output_directory = "mimic_data"
+    use_batch_api = False  # OpenAI Batch API (halbe Kosten, Ergebnis innerhalb von 24 Stunden)
     
     # Prüfen, wie viele Fälle bereits existieren
-    cases_file = os.path.join(output_directory, 'cases.json')
-    existing_count = 0
-    
-    if os.path.exists(cases_file):
-        try:
-            with open(cases_file, 'r', encoding='utf-8') as f:
-                existing_cases = json.load(f)
-                existing_count = len(existing_cases)
-        except Exception as e:
-            print(f"Fehler beim Laden bestehender Daten: {str(e)}")
+    existing_count = len(load_cases(output_directory))
     
     # Berechne, wie viele weitere Fälle generiert werden sollen
     cases_to_generate = min(total_cases, max_total - existing_count)
@@ -502,12 +1242,19 @@ if __name__ == "__main__":
     else:
         print(f"Generiere {cases_to_generate} weitere Fälle (Aktuell: {existing_count}, Ziel: {max_total})")
         
-        result = generate_patient_cases(
-            total_count=cases_to_generate, 
-            batch_size=batch_size, 
-            min_score=min_quality_score, 
-            output_dir=output_directory
-        )
+        if use_batch_api:
+            result = generate_patient_cases_batch(
+                total_count=cases_to_generate,
+                min_score=min_quality_score,
+                output_dir=output_directory
+            )
+        else:
+            result = generate_patient_cases(
+                total_count=cases_to_generate, 
+                batch_size=batch_size, 
+                min_score=min_quality_score, 
+                output_dir=output_directory
+            )
     if cases_to_generate > 0:
         print(f"\nGENERIERUNG ABGESCHLOSSEN\n{'='*30}")
         print(f"Neu generierte Fälle: {result['cases_count']}")